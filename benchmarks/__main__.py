@@ -0,0 +1,163 @@
+"""
+Benchmark lecdown against a local mock course server and synthetic workspaces.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks --records 10000 --files 200 --latency 0.005
+
+Results are appended to benchmarks/results.ndjson together with the current
+commit, and compared with the last run of another commit with the same
+parameters.
+"""
+import argparse
+from contextlib import contextmanager, redirect_stdout
+import io
+import json
+import os
+import os.path
+import subprocess
+import tempfile
+import time
+
+from lecdown import config as config_module
+from lecdown.config import config_read, config_write, open_config
+from lecdown.downloader import check_all, download_all
+from lecdown.main import main
+
+from .server import CourseServer
+from .workspace import make_workspace
+
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.ndjson')
+
+
+@contextmanager
+def workspace_dir():
+    # Not in /tmp, since tmpfs on Linux does not support extended attributes
+    cwd = os.getcwd()
+    files = config_module.LOCAL_CONFIG_FILE, config_module.GLOBAL_CONFIG_FILE
+    with tempfile.TemporaryDirectory(dir=cwd, prefix='.bench-') as name:
+        os.chdir(name)
+        config_module.LOCAL_CONFIG_FILE = os.path.join(name, 'lecdown.json')
+        config_module.GLOBAL_CONFIG_FILE = os.path.join(name, 'lecdown-global.json')
+        config_write(config_module.GLOBAL_CONFIG_FILE, config_module.get_default_global_config())
+        try:
+            yield name
+        finally:
+            os.chdir(cwd)
+            config_module.LOCAL_CONFIG_FILE, config_module.GLOBAL_CONFIG_FILE = files
+
+
+def timeit(func, repeat):
+    # Best of `repeat` runs, with output suppressed
+    best = None
+    for _ in range(repeat):
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmarks(args):
+    results = {}
+
+    with workspace_dir() as path:
+        make_workspace(path, args.records)
+
+        results['config_read'] = timeit(lambda: config_read('lecdown.json'), args.repeat)
+        obj = config_read('lecdown.json')
+        results['config_write'] = timeit(lambda: config_write('lecdown.json', obj), args.repeat)
+
+        def check():
+            with open_config():
+                check_all()
+        results['check_all'] = timeit(check, args.repeat)
+
+        def check_moved():
+            os.rename(os.path.join('dir0', 'file0.pdf'), 'moved.pdf')
+            with open_config():
+                check_all()
+            os.rename('moved.pdf', os.path.join('dir0', 'file0.pdf'))
+            with open_config():
+                check_all()
+        results['check_all_moved'] = timeit(check_moved, args.repeat) / 2
+
+        results['ls'] = timeit(lambda: main(['ls']), args.repeat)
+
+    server = CourseServer(
+        courses=args.courses, files=args.files, file_size=args.file_size,
+        latency=args.latency).start()
+    try:
+        with workspace_dir() as path:
+            make_workspace(path, 0, sources=[server.source(c) for c in range(args.courses)])
+
+            def download():
+                with open_config():
+                    download_all()
+            results['download_all_new'] = timeit(download, 1)
+            results['download_all_unchanged'] = timeit(download, args.repeat)
+    finally:
+        server.stop()
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results():
+    try:
+        with open(RESULTS_FILE) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+parser = argparse.ArgumentParser(description='Benchmark lecdown.')
+parser.add_argument('--records', type=int, default=1000, help='Records in synthetic workspace')
+parser.add_argument('--courses', type=int, default=2, help='Course pages on the mock server')
+parser.add_argument('--files', type=int, default=50, help='Files per course page')
+parser.add_argument('--file-size', type=int, default=64 * 1024, help='Bytes per file')
+parser.add_argument('--latency', type=float, default=0.0, help='Server latency in seconds')
+parser.add_argument('--repeat', type=int, default=3, help='Take the best of this many runs')
+parser.add_argument('--no-save', action='store_true', help='Do not save the results')
+
+
+def main_benchmark(args=None):
+    args = parser.parse_args(args=args)
+    params = {k: v for k, v in vars(args).items() if k not in ('repeat', 'no_save')}
+    commit = git_commit()
+
+    results = run_benchmarks(args)
+
+    previous = next(
+        (r for r in reversed(load_results()) if r['params'] == params and r['commit'] != commit),
+        None)
+
+    print('{:<26}{:>12}{:>12}{:>10}'.format(
+        'benchmark', 'seconds', previous['commit'] if previous else '', ''))
+    for name, seconds in results.items():
+        before = previous and previous['results'].get(name)
+        print('{:<26}{:>12.4f}{:>12}{:>10}'.format(
+            name, seconds,
+            '{:.4f}'.format(before) if before else '',
+            '{:+.0%}'.format(seconds / before - 1) if before else ''))
+
+    if not args.no_save:
+        with open(RESULTS_FILE, 'a') as f:
+            f.write(json.dumps({
+                'commit': commit, 'time': time.time(), 'params': params, 'results': results
+                }) + '\n')
+
+    return results
+
+
+if __name__ == '__main__':
+    main_benchmark()
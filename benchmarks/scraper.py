@@ -0,0 +1,34 @@
+from html.parser import HTMLParser
+import urllib.parse
+
+from lecdown.cookies import CookieJar
+from lecdown.scrapers import SeleniumScraper, http_session
+
+
+class LinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        href = dict(attrs).get('href')
+        if tag == 'a' and href:
+            self.links.append(href)
+
+
+class LinkScraper(SeleniumScraper):
+    """
+    Collects links with plain HTTP requests instead of a browser, so that
+    benchmarks do not depend on Chrome. Files are downloaded like
+    SeleniumScraper does.
+    """
+    def collect_resources(self, sources, cookies):
+        self.jar = CookieJar(cookies)
+        links = {}
+        for source in sources:
+            parser = LinkParser()
+            parser.feed(http_session().get(source['source']).text)
+            for href in parser.links:
+                link = urllib.parse.urljoin(source['source'], href).partition('#')[0]
+                links.setdefault(link, source['source'])
+        return [{'url': link, 'source': source} for link, source in links.items()]
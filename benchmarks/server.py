@@ -0,0 +1,93 @@
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import re
+import threading
+import time
+import urllib.parse
+
+
+class CourseServer(ThreadingHTTPServer):
+    """
+    Serves `courses` generated course pages at /course/<n>, each linking to
+    `files` files of `file_size` bytes at /files/<n>/<m>.pdf. Files support
+    ETags and Range requests, and every response is delayed by `latency`
+    seconds. Bump `versions[path]` to simulate an updated file.
+    """
+    daemon_threads = True
+
+    def __init__(self, courses=1, files=10, file_size=1024, latency=0.0):
+        super().__init__(('127.0.0.1', 0), CourseHandler)
+        self.courses = courses
+        self.files = files
+        self.file_size = file_size
+        self.latency = latency
+        self.versions = {}
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def source(self, course):
+        return '{}/course/{}'.format(self.url, course)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class CourseHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, code, body=b'', headers={}):
+        self.send_response(code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        path = urllib.parse.urlparse(self.path).path
+
+        match = re.fullmatch(r'/course/(\d+)', path)
+        if match and int(match.group(1)) < self.server.courses:
+            links = ''.join(
+                '<li><a href="/files/{0}/{1}.pdf">Lecture {1}</a></li>'.format(match.group(1), m)
+                for m in range(self.server.files))
+            body = '<html><body><h1>{}</h1><ul>{}</ul></body></html>'.format(
+                escape(path), links).encode()
+            self.send(200, body, {'Content-Type': 'text/html; charset=utf-8'})
+            return
+
+        match = re.fullmatch(r'/files/(\d+)/(\d+)\.pdf', path)
+        if not match or int(match.group(1)) >= self.server.courses \
+                or int(match.group(2)) >= self.server.files:
+            self.send(404)
+            return
+
+        version = self.server.versions.get(path, 0)
+        etag = '"{}-{}"'.format(path.replace('/', '-'), version)
+        headers = {'Content-Type': 'application/pdf', 'ETag': etag, 'Accept-Ranges': 'bytes'}
+        if self.headers.get('If-None-Match') == etag:
+            self.send(304, headers=headers)
+            return
+
+        line = '{} version {}\n'.format(path, version).encode()
+        body = (line * (self.server.file_size // len(line) + 1))[:self.server.file_size]
+
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1) or 0)
+            end = min(int(match.group(2) or len(body) - 1), len(body) - 1)
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, len(body))
+            self.send(206, body[start:end + 1], headers)
+        else:
+            self.send(200, body, headers)
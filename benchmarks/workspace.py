@@ -0,0 +1,37 @@
+import os
+import os.path
+import time
+
+from lecdown.config import Record, Status, Strategy, config_write, get_default_local_config
+from lecdown.downloader import file_digest, stat_inode, stat_signature
+
+
+def make_workspace(path, records, file_size=1024, dirs=10, sources=['http://127.0.0.1/course/0']):
+    """
+    Create a workspace in `path` with `records` downloaded files spread over
+    `dirs` subdirectories, and a lecdown.json tracking them.
+    """
+    local_obj = get_default_local_config()
+    for source in sources:
+        local_obj['sources'].append(
+            {'source': source, 'scraper': 'benchmarks.scraper.LinkScraper'})
+
+    updated_at = time.time() - 60
+    for i in range(records):
+        local_path = os.path.join('dir{}'.format(i % dirs), 'file{}.pdf'.format(i))
+        os.makedirs(os.path.join(path, os.path.dirname(local_path)), exist_ok=True)
+        with open(os.path.join(path, local_path), 'wb') as f:
+            f.write(('file {}\n'.format(i).encode() * file_size)[:file_size])
+        os.utime(os.path.join(path, local_path), (updated_at - 60, updated_at - 60))
+
+        stat = os.stat(os.path.join(path, local_path))
+        sha = file_digest(os.path.join(path, local_path))
+        url = 'http://127.0.0.1/files/synthetic/{}.pdf'.format(i)
+        local_obj['records'][url] = Record(
+            last_status=Status.UPDATED, discovered_at=updated_at, updated_at=updated_at,
+            filename='file{}.pdf'.format(i), content_type='application/pdf',
+            scraper_attrs={'etag': '"{}"'.format(i)}, sha=sha, source=sources[0],
+            local_path=local_path, inode=stat_inode(stat),
+            local_signature=stat_signature(stat), local_sha=sha, strategy=Strategy.SYNC)
+
+    config_write(os.path.join(path, 'lecdown.json'), local_obj)
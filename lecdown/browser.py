@@ -1,13 +1,50 @@
 from contextlib import contextmanager
 
-from selenium import webdriver
+from .metrics import metrics
+
+
+# Browser reused by open_driver() within shared_driver()
+shared = {'active': False, 'driver': None}
+
+
+def start_driver(headless=False):
+    # Selenium is slow to import, so only load it when a browser is needed
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless=new')
+    with metrics.phase('browser start'):
+        return webdriver.Chrome(options=options)
 
 
 @contextmanager
 def open_driver():
-    driver = webdriver.Chrome()
+    if shared['active']:
+        if not shared['driver']:
+            shared['driver'] = start_driver()
+        yield shared['driver']
+        return
+
+    driver = start_driver()
 
     try:
         yield driver
     finally:
         driver.quit()
+
+
+@contextmanager
+def shared_driver():
+    """
+    Reuse a single browser for all open_driver() calls in this context. The
+    browser is only started when first needed.
+    """
+    shared['active'] = True
+    try:
+        yield
+    finally:
+        shared['active'] = False
+        if shared['driver']:
+            shared['driver'].quit()
+            shared['driver'] = None
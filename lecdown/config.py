@@ -10,6 +10,7 @@ class Strategy:
     SYNC = 'sync'
     IGNORE = 'ignore'
     ONCE = 'once'
+    PRINT = 'print'  # Render HTML pages to PDF
 
 
 class Status:
@@ -34,10 +35,21 @@ class Record:
         self.filename = None
         self.content_type = None
         self.scraper_attrs = None
+        # Source page where this url was first discovered
+        self.source = None
         self.sha = None
+        # Digest of the web page last rendered to PDF, for Strategy.PRINT
+        self.page_sha = None
+        # hashlib algorithm of sha and local_sha
+        self.hash_algorithm = 'sha1'
 
         self.local_path = None
         self.local_modified = False
+        # (st_dev, st_ino) of local_path, used to follow moves without xattrs
+        self.inode = None
+        # Digest of local_path, valid while its stat signature is unchanged
+        self.local_signature = None
+        self.local_sha = None
 
         self.strategy = Strategy.AUTO
 
@@ -74,7 +86,11 @@ def create_config():
 
 
 @contextmanager
-def open_config():
+def open_config(write=True):
+    """
+    Load the global and local config into `config`, and write changes back on
+    exit unless `write` is False.
+    """
     config.clear()
     try:
         global_obj = config_read(GLOBAL_CONFIG_FILE)
@@ -93,8 +109,14 @@ def open_config():
 
     yield
 
+    if not write:
+        return
+
     for key in WRITABLE_LOCAL_KEYS:
-        local_obj[key] = config[key]
+        if key in config:
+            local_obj[key] = config[key]
+        else:
+            local_obj.pop(key, None)
     config_write(LOCAL_CONFIG_FILE, local_obj)
 
     for key in WRITABLE_GLOBAL_KEYS:
@@ -102,11 +124,34 @@ def open_config():
     config_write(GLOBAL_CONFIG_FILE, global_obj)
 
 
+def find_workspaces(paths=None):
+    """
+    Yield directories containing a local config file, searching `paths`
+    recursively. Hidden directories and subdirectories of workspaces are skipped.
+
+    By default, the "workspaces" in the global config or the current directory
+    are searched.
+    """
+    if not paths:
+        try:
+            paths = config_read(GLOBAL_CONFIG_FILE).get('workspaces')
+        except FileNotFoundError:
+            pass
+    for path in paths or ['.']:
+        for root, dirs, files in os.walk(os.path.expanduser(path)):
+            if os.path.basename(LOCAL_CONFIG_FILE) in files:
+                yield root
+                del dirs[:]
+            else:
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+
+
 def get_base_config():
     return OrderedDict([
         ('renamers', []),
         ('depth', 0),
-        ('cookies', {})
+        ('hash', 'sha1'),
+        ('cookies', [])
         ])
 
 
@@ -114,6 +159,7 @@ def get_default_global_config():
     return OrderedDict([
         ('renamers', []),
         ('depth', 0),
+        ('hash', 'sha1'),
         ('cookies', []),
         ('accounts', [])
         ])
@@ -132,5 +178,5 @@ GLOBAL_CONFIG_FILE = os.path.join(os.path.expanduser("~"), '.lecdown.json')
 LOCAL_CONFIG_FILE = 'lecdown.json'
 
 WRITABLE_GLOBAL_KEYS = ['cookies']
-WRITABLE_LOCAL_KEYS = ['sources', 'records']
+WRITABLE_LOCAL_KEYS = ['sources', 'records', 'watch']
 MERGEABLE_KEYS = ['renamers']
@@ -0,0 +1,88 @@
+import time
+import urllib.parse
+
+
+def normalize_domain(domain):
+    return domain.lstrip('.').lower()
+
+
+def path_matches(path, cookie_path):
+    # RFC 6265 section 5.1.4
+    if path == cookie_path:
+        return True
+    return path.startswith(cookie_path) and \
+        (cookie_path.endswith('/') or path[len(cookie_path)] == '/')
+
+
+class CookieJar:
+    """
+    Cookies in the format of Selenium's get_cookies(), indexed by domain.
+
+    A cookie replaces an earlier one with the same domain, path and name, and
+    expired cookies are dropped. Iterating over the jar yields all cookies.
+    """
+    def __init__(self, cookies=()):
+        # Domain -> {(path, name): cookie}
+        self.domains = {}
+        self.add(cookies)
+
+    def add(self, cookies):
+        now = time.time()
+        for cookie in cookies:
+            domain = normalize_domain(cookie['domain'])
+            key = (cookie.get('path') or '/', cookie['name'])
+            if 'expiry' in cookie and cookie['expiry'] < now:
+                self.domains.get(domain, {}).pop(key, None)
+            else:
+                self.domains.setdefault(domain, {})[key] = cookie
+        return self
+
+    def __iter__(self):
+        now = time.time()
+        for domain in sorted(self.domains):
+            for key in sorted(self.domains[domain]):
+                cookie = self.domains[domain][key]
+                if not ('expiry' in cookie and cookie['expiry'] < now):
+                    yield cookie
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def for_url(self, url):
+        """
+        Returns the cookies to send to `url`, following the domain and path
+        matching rules of RFC 6265, longest paths first.
+        """
+        parsed = urllib.parse.urlparse(url)
+        host = (parsed.hostname or '').lower()
+        path = parsed.path or '/'
+        now = time.time()
+
+        cookies = []
+        labels = host.split('.')
+        for i in range(len(labels)):
+            domain = '.'.join(labels[i:])
+            for (cookie_path, _), cookie in self.domains.get(domain, {}).items():
+                # Cookies without a leading dot are host-only
+                if domain != host and not cookie['domain'].startswith('.'):
+                    continue
+                if not path_matches(path, cookie_path):
+                    continue
+                if cookie.get('secure') and parsed.scheme != 'https':
+                    continue
+                if 'expiry' in cookie and cookie['expiry'] < now:
+                    continue
+                cookies.append(cookie)
+        cookies.sort(key=lambda c: -len(c.get('path') or '/'))
+        return cookies
+
+    def values_for_url(self, url):
+        """
+        Returns the cookies to send to `url` as a {name: value} dict, e.g. for
+        requests.
+        """
+        values = {}
+        # Longer paths take precedence
+        for cookie in reversed(self.for_url(url)):
+            values[cookie['name']] = cookie['value']
+        return values
@@ -1,44 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
 import importlib
 import hashlib
 import mimetypes
 import os.path
 import re
+from stat import S_ISDIR, S_ISLNK
 import textwrap
+import threading
 import time
 import traceback
 import urllib.parse
-from xattr import xattr
 
 from .config import Record, Status, Strategy, config
+from .cookies import CookieJar
+from .metrics import metrics
+from .progress import Progress, tracking
+from .renamer import compile_renamers
+from .renderer import renderers
+from .urls import canonicalize_url, scheme_variant
 
 
 # We use this extended file attribute to indicate the URL of a file
 XATTR_KEY_URL = 'user.lecdown.url'
 
+# Number of threads used to stat and hash tracked files in check_all
+CHECK_THREADS = 8
 
-def select_strategy(filename, content_type, **kwargs):
+# Number of concurrent requests to check for updates in plan_all
+PLAN_THREADS = 16
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+DEFAULT_DOWNLOAD_CONFIG = {
+    # Number of files downloaded at the same time
+    'threads': 4,
+    # Sort keys of the download queue, from the keys of PRIORITIES
+    'order': ['source', 'new', 'changing', 'small'],
+}
+
+# A file counts as changing if a new version was found this long after it was
+# discovered
+CHANGING_AFTER = 60 * 60
+
+
+def select_strategy(filename, content_type, print_html=False, **kwargs):
     if content_type and content_type.startswith('text/html'):
-        return Strategy.IGNORE
+        return Strategy.PRINT if print_html else Strategy.IGNORE
     else:
         return Strategy.SYNC
 
 
+def ignored_page(resource, record):
+    """
+    Whether `record` is a web page that was ignored automatically, before its
+    source opted in to "print_html".
+    """
+    return resource.get('print_html') and record.strategy == Strategy.IGNORE and \
+        record.last_status == Status.NONE and \
+        (record.content_type or '').startswith('text/html')
+
+
 def select_filename(filename, content_type):
     if '.' not in filename:
         filename += mimetypes.guess_extension(content_type or '') or ''
     return filename
 
 
-def cleanup_filename(filename):
-    filename = re.sub(r'(?i)\b(lecture|lec|l)\s?\b', '', filename)
-    filename = re.sub(r'(?i)\b(tutorial|tut|t)\s?\b', 'T', filename)
-    filename = re.sub(r'(?i)\b(assignment|assgn|asgn|assg|ass)\s?\b', 'HW', filename)
-    filename = filename.replace('-', '')
-    if filename.endswith('.pdf'):
-        filename = filename[0].upper() + filename[1:]
-    return filename
-
-
 def sanitize_filename(filename):
     # Remove special characters
     for c in r'[]/\;><&*:%=+@!#^()|?^':
@@ -52,26 +79,163 @@ def sanitize_filename(filename):
     return filename
 
 
-def file_digest(fname):
-    hasher = hashlib.sha1()
-    with open(fname, 'rb') as f:
-        hasher = hashlib.sha1()
-        for block in iter(lambda: f.read(4096), b''):
-            hasher.update(block)
+def file_digest(fname, algorithm='sha1'):
+    # Read into a reused buffer without copying. hashlib releases the GIL for
+    # large updates, so this also runs in parallel on the check_all pool.
+    hasher = hashlib.new(algorithm)
+    buf = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buf)
+    with metrics.phase('hash'), open(fname, 'rb', buffering=0) as f:
+        while True:
+            size = f.readinto(buf)
+            if not size:
+                break
+            hasher.update(view[:size])
+            metrics.count('hashed bytes', size)
     return hasher.hexdigest()
 
 
-def generate_filename(hint):
-    basename, dot, ext = sanitize_filename(hint).partition('.')
-    filename = hint
-    serial = 0
-    while os.path.exists(filename):
-        filename = basename + '.{}'.format(serial) + dot + ext
-        serial += 1
+def xattr(path):
+    # The xattr package loads cffi, which is slow to import. Since moves are
+    # mostly detected by inode, only load it when we actually need it.
+    from xattr import xattr
+    return xattr(path)
+
+
+def stat_inode(stat):
+    return [stat.st_dev, stat.st_ino]
+
+
+def stat_signature(stat):
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_ctime_ns]
+
+
+def signature_matches(record, stat):
+    """
+    Whether the file with `stat` may be the file of `record` that was moved.
+    Freed inodes are reused right away, but a move keeps the size and mtime.
+    """
+    signature = record.local_signature
+    return bool(signature) and signature[:2] == [stat.st_size, stat.st_mtime_ns]
+
+
+def track_file(record, url):
+    """
+    Mark `record.local_path` as the file for `url`, after it has been replaced
+    by a download with digest `record.sha`.
+    """
+    try:
+        xattr(record.local_path).set(XATTR_KEY_URL, url.encode())
+    except OSError:
+        # e.g. no xattr support; the inode still identifies the file
+        pass
+    stat = os.stat(record.local_path)
+    record.inode = stat_inode(stat)
+    record.local_signature = stat_signature(stat)
+    record.local_sha = record.sha
+
+
+class FilenameAllocator:
+    """
+    Hands out unique filenames within a run. Each directory is listed once, and
+    names handed out are remembered, so that concurrent downloads never get the
+    same name. If `hint` is taken, a serial is added, e.g. "notes.0.pdf".
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Directory -> names taken in it
+        self.names = {}
+        # (directory, basename, ext) -> next serial to try
+        self.serials = {}
+
+    def taken(self, dirname):
+        if dirname not in self.names:
+            try:
+                self.names[dirname] = set(os.listdir(dirname or '.'))
+            except FileNotFoundError:
+                self.names[dirname] = set()
+        return self.names[dirname]
+
+    def reserve(self, hint):
+        """
+        Returns an unused filename for `hint`, without creating the file.
+        """
+        dirname, name = os.path.split(hint)
+        with self.lock:
+            taken = self.taken(dirname)
+            if name in taken:
+                basename, dot, ext = sanitize_filename(name).partition('.')
+                key = (dirname, basename, dot + ext)
+                serial = self.serials.get(key, 0)
+                while True:
+                    name = basename + '.{}'.format(serial) + dot + ext
+                    serial += 1
+                    if name not in taken:
+                        break
+                self.serials[key] = serial
+            taken.add(name)
+        return os.path.join(dirname, name)
+
+    def create(self, hint):
+        """
+        Returns an unused filename for `hint`, after creating an empty file there
+        exclusively. Replace it with os.replace() to move a file there.
+        """
+        while True:
+            filename = self.reserve(hint)
+            try:
+                os.close(os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            except FileExistsError:
+                # Created by someone else since the directory was listed
+                continue
+            return filename
+
+    def release(self, filename):
+        dirname, name = os.path.split(filename)
+        with self.lock:
+            self.taken(dirname).discard(name)
+
+
+def render_page(resource, save_to, record, jar):
+    """
+    Replace the web page downloaded to `save_to` with a PDF rendering of it,
+    unless the page is unchanged since it was last rendered. `jar` is the
+    CookieJar to load the page with.
+    """
+    page_sha = file_digest(save_to, record.hash_algorithm)
+    os.unlink(save_to)
+    if page_sha == record.page_sha and record.local_path:
+        return {'status': Status.UP_TO_DATE}
+
+    renderers.render(
+        resource['url'], save_to, cookies=jar.for_url(resource['url']))
+    record.page_sha = page_sha
+    record.filename = (os.path.splitext(record.filename or '')[0] or 'page') + '.pdf'
+    record.content_type = 'application/pdf'
+    return {
+        'status': Status.UPDATED,
+        'filename': record.filename,
+        'content_type': record.content_type
+        }
+
+
+def plan_filename(filename, url, content_type, renamer):
+    """
+    Returns the local filename for a file downloaded from `url`, before
+    avoiding collisions.
+    """
+    filename = select_filename(filename, content_type)
+    try:
+        renamed = renamer(filename, url=url, content_type=content_type)
+    except (KeyError, IndexError, AttributeError, ValueError):
+        # A template that cannot be formatted, e.g. a group that did not match
+        renamed = filename
+    if renamed != filename:
+        filename = sanitize_filename(renamed) or filename
     return filename
 
 
-def download_one(scraper, resource, record):
+def download_one(scraper, resource, record, renamer=None, allocator=None):
     """
     Download a single file for the given info.
 
@@ -79,12 +243,15 @@ def download_one(scraper, resource, record):
     given file. It relies on `local_modified` being correctly set by `check_all`
     to process files correctly.
     """
+    if ignored_page(resource, record):
+        record.strategy = Strategy.PRINT
     if record.strategy == Strategy.IGNORE:
         return Status.SKIPPED, None
 
+    allocator = allocator or FilenameAllocator()
     url_basename = urllib.parse.unquote(resource['url'].rstrip('/').rpartition('/')[2])
     basename = record.local_path or url_basename or 'untitled'
-    save_to = generate_filename(basename + '.download')
+    save_to = allocator.reserve(basename + '.download')
 
     result = {
         'status': Status.ERROR,
@@ -94,7 +261,8 @@ def download_one(scraper, resource, record):
         'scraper_attrs': record.scraper_attrs
         }
     try:
-        result.update(scraper.download_file(resource, save_to, record.scraper_attrs))
+        with metrics.phase('download file'):
+            result.update(scraper.download_file(resource, save_to, record.scraper_attrs))
     except Exception:
         result.update({
             'description': traceback.format_exc(),
@@ -114,32 +282,62 @@ def download_one(scraper, resource, record):
         if record.strategy == Strategy.IGNORE and result['status'] == Status.UPDATED:
             # We don't need the file, so let's clean up
             os.unlink(save_to)
+            allocator.release(save_to)
             return Status.SKIPPED, None
 
+    if record.strategy == Strategy.PRINT and result['status'] == Status.UPDATED:
+        try:
+            # Prefer the scraper's cookies, which include those from logging in
+            jar = getattr(scraper, 'jar', None)
+            if jar is None:
+                jar = CookieJar(config['cookies'])
+            result.update(render_page(resource, save_to, record, jar))
+        except Exception:
+            result.update({
+                'status': Status.ERROR,
+                'description': traceback.format_exc(),
+                })
+
     record.last_status = result['status']
 
     description = result['description']
 
+    if result['status'] != Status.UPDATED:
+        # Remove what a failed download may have written so far
+        try:
+            os.unlink(save_to)
+        except FileNotFoundError:
+            pass
+        allocator.release(save_to)
+
     if result['status'] == Status.UPDATED:
         record.updated_at = time.time()
 
-        record.sha = file_digest(save_to)
+        algorithm = config.get('hash', 'sha1')
+        if algorithm != record.hash_algorithm:
+            record.hash_algorithm = algorithm
+            record.local_sha = None
+        record.sha = file_digest(save_to, algorithm)
 
-        # Handle the downloaded file
+        # Handle the downloaded file. New names are created exclusively, so we
+        # never overwrite a file we do not track.
         if not record.local_path:
-            record.local_path = generate_filename(
-                select_filename(result['filename'] or basename, record.content_type))
-            os.rename(save_to, record.local_path)
-            xattr(record.local_path).set(XATTR_KEY_URL, resource['url'].encode())
+            record.local_path = allocator.create(plan_filename(
+                result['filename'] or basename, resource['key'], record.content_type,
+                renamer or compile_renamers(config['renamers'])))
+            os.replace(save_to, record.local_path)
+            track_file(record, resource['key'])
         elif not record.local_modified:
-            os.unlink(record.local_path)
-            os.rename(save_to, record.local_path)
-            xattr(record.local_path).set(XATTR_KEY_URL, resource['url'].encode())
+            os.replace(save_to, record.local_path)
+            track_file(record, resource['key'])
         else:
-            basename, dot, ext = record.local_path.partition('.')
-            updated_local_path = generate_filename(basename + '.updated' + dot + ext)
-            os.rename(save_to, updated_local_path)
+            dirname, name = os.path.split(record.local_path)
+            basename, dot, ext = name.partition('.')
+            updated_local_path = allocator.create(
+                os.path.join(dirname, basename + '.updated' + dot + ext))
+            os.replace(save_to, updated_local_path)
             description = 'Saved updated version to {}'.format(updated_local_path)
+        allocator.release(save_to)
 
         if record.strategy == Strategy.ONCE:
             record.strategy = Strategy.IGNORE
@@ -148,70 +346,301 @@ def download_one(scraper, resource, record):
     return result['status'], description
 
 
+def get_download_config():
+    options = dict(DEFAULT_DOWNLOAD_CONFIG)
+    options.update(config.get('download') or {})
+    return options
+
+
+def expected_size(record):
+    return record.local_signature[0] if record.local_signature else None
+
+
+# Sort keys of a queued (resource, record, source options), smaller first
+PRIORITIES = {
+    # Sources with a higher "priority" option first
+    'source': lambda resource, record, source: -source.get('priority', 0),
+    # Links never downloaded before first
+    'new': lambda resource, record, source: record.strategy != Strategy.AUTO,
+    # Files that were updated before first
+    'changing': lambda resource, record, source: not (
+        record.updated_at and record.updated_at - record.discovered_at > CHANGING_AFTER),
+    # Smaller files first, by the size of the last version
+    'small': lambda resource, record, source: expected_size(record) or 0,
+}
+
+
+def prioritize(queue, order):
+    """
+    Sort the download queue by the `order` keys of PRIORITIES. Ties keep the
+    order of the scraper.
+    """
+    for key in order:
+        if key not in PRIORITIES:
+            raise ValueError('Unknown download priority "{}"'.format(key))
+    return sorted(queue, key=lambda item: tuple(PRIORITIES[key](*item) for key in order))
+
+
+def report_download(progress, resource, record, orig_strategy, status, description, verbose):
+    if verbose or description or status in (Status.UPDATED, Status.ERROR) \
+            or orig_strategy == Strategy.AUTO:
+        tags = ''
+        if orig_strategy == Strategy.AUTO and status == Status.UPDATED:
+            tags += ' [NEW]'
+        elif orig_strategy == Strategy.AUTO and status == Status.SKIPPED:
+            tags += ' [NEW, IGNORED]'
+        filename = record.local_path or '[{}]'.format(record.filename or 'file')
+        filename += tags
+        lines = ['{:<40}{:<12}{:<20}{}'.format(
+            filename,
+            status.upper(),
+            (record.content_type or '').partition(';')[0],
+            urllib.parse.unquote(resource['url']))]
+        if description:
+            lines.append(textwrap.indent(description, '    ') + '\n')
+        progress.print('\n'.join(lines))
+
+
+def resolve_resources(resources, sources, records):
+    """
+    Yields (resource, source options) for the resources collected from
+    `sources`. Each resource gets a "key" to track it by: the key of an existing
+    record with the same canonical url (preferring the same scheme), or else
+    the canonical url. Each key is yielded once.
+
+    The "url" stays the url the page links (without the fragment), so that
+    e.g. an https link to a record tracked through http is fetched over https.
+    """
+    options = {s['source']: s for s in sources}
+
+    # Canonical url -> key of existing records, including records tracked
+    # before urls were canonicalized
+    index = {}
+    for key, record in records.items():
+        strip_params = options.get(record.source, {}).get('strip_params', ())
+        canonical = canonicalize_url(key, strip_params)
+        if canonical not in index or key == canonical:
+            index[canonical] = key
+
+    seen = set()
+
+    for resource in resources:
+        source = options.get(resource.get('source')) or (sources[0] if len(sources) == 1 else {})
+
+        url = canonicalize_url(resource['url'], source.get('strip_params', ()))
+        # Possibly tracked through the other scheme
+        key = index.get(url) or index.get(scheme_variant(url)) or url
+        if key in seen:
+            continue
+        seen.add(key)
+
+        yield dict(resource, url=resource['url'].partition('#')[0], key=key,
+                   print_html=bool(source.get('print_html'))), source
+
+
 def download_with_scraper(scraper_name, sources, verbose=False):
     records = config['records']
     module, _, class_name = scraper_name.rpartition('.')
     Scraper = getattr(importlib.import_module(module), class_name)
     scraper = Scraper()
 
-    resources = scraper.collect_resources(sources, cookies=config['cookies'])
+    with metrics.phase('scrape'):
+        resources = scraper.collect_resources(sources, cookies=CookieJar(config['cookies']))
 
-    results = []
+    download_config = get_download_config()
+    renamer = compile_renamers(config['renamers'])
+    allocator = FilenameAllocator()
 
-    for resource in resources:
-        record = records.get(resource['url'])
+    queue = []
+
+    for resource, source in resolve_resources(resources, sources, records):
+        record = records.get(resource['key'])
         if not record:
-            record = records[resource['url']] = Record()
+            record = records[resource['key']] = Record(source=resource.get('source'))
+        queue.append((resource, record, source))
+
+    queue = prioritize(queue, download_config['order'])
+    progress = Progress([expected_size(record) for _, record, _ in queue])
+
+    def download(item):
+        resource, record, _ = item
         orig_strategy = record.strategy
+        progress.start()
+        try:
+            status, description = download_one(scraper, resource, record, renamer, allocator)
+        finally:
+            progress.finish()
+        report_download(progress, resource, record, orig_strategy, status, description, verbose)
+        return status, description
+
+    with tracking(progress), \
+            ThreadPoolExecutor(max_workers=download_config['threads']) as executor:
+        return list(executor.map(download, queue))
+
+
+
+def download_all(verbose=False, sources=None):
+    """
+    Classify sources (by default, all configured sources) by scrapers and
+    invoke them.
+    """
+    if sources is None:
+        sources = config['sources']
+
+    scrapers = {}
+    for source in sources:
+        scrapers.setdefault(source['scraper'], []).append(source)
 
-        status, description = download_one(scraper, resource, record)
-        results.append((status, description))
-
-        if verbose or description or status in (Status.UPDATED, Status.ERROR) \
-                or orig_strategy == Strategy.AUTO:
-            tags = ''
-            if orig_strategy == Strategy.AUTO and status == Status.UPDATED:
-                tags += ' [NEW]'
-            elif orig_strategy == Strategy.AUTO and status == Status.SKIPPED:
-                tags += ' [NEW, IGNORED]'
-            filename = record.local_path or '[{}]'.format(record.filename or 'file')
-            filename += tags
-            print('{:<40}{:<12}{:<20}{}'.format(
-                filename,
-                status.upper(),
-                (record.content_type or '').partition(';')[0],
-                urllib.parse.unquote(resource['url'])))
-            if description:
-                print(textwrap.indent(description, '    '))
-                print()
+    results = []
+    try:
+        with metrics.phase('download'):
+            for scraper_name, subsources in scrapers.items():
+                results.extend(download_with_scraper(scraper_name, subsources, verbose=verbose))
+    finally:
+        renderers.close()
 
     return results
 
 
+class Change:
+    NEW = 'new'
+    UPDATED = 'updated'
+    GONE = 'gone'
+    UNCHANGED = 'unchanged'
+    UNKNOWN = 'unknown'  # The scraper cannot check without downloading
+    ERROR = 'error'
+
+
+def plan_with_scraper(scraper_name, sources):
+    records = config['records']
+    module, _, class_name = scraper_name.rpartition('.')
+    Scraper = getattr(importlib.import_module(module), class_name)
+    scraper = Scraper()
+
+    with metrics.phase('scrape'):
+        resources = scraper.collect_resources(sources, cookies=CookieJar(config['cookies']))
+
+    queue = []
+    for resource, source in resolve_resources(resources, sources, records):
+        record = records.get(resource['key'])
+        if record and record.strategy == Strategy.IGNORE and not ignored_page(resource, record):
+            continue
+        queue.append((resource, record))
+
+    def check(item):
+        resource, record = item
+        new = not record or record.strategy == Strategy.AUTO
+        try:
+            result = scraper.check_file(resource, record.scraper_attrs if record else None)
+        except Exception:
+            return Change.ERROR, resource['key'], None, traceback.format_exc()
+        change = {
+            Status.UPDATED: Change.NEW if new else Change.UPDATED,
+            Status.UP_TO_DATE: Change.UNCHANGED,
+            Status.NOT_FOUND: Change.GONE,
+            Status.ERROR: Change.ERROR,
+            None: Change.NEW if new else Change.UNKNOWN,
+            }.get(result.get('status'), Change.UNKNOWN)
+        return change, resource['key'], result.get('size'), result.get('description')
+
+    with metrics.phase('check remote'), ThreadPoolExecutor(max_workers=PLAN_THREADS) as executor:
+        results = list(executor.map(check, queue))
+
+    # Tracked links that the sources no longer have
+    found = {resource['key'] for resource, _ in queue}
+    source_urls = {s['source'] for s in sources}
+    for url, record in records.items():
+        if url not in found and record.strategy not in (Strategy.AUTO, Strategy.IGNORE) and \
+                (record.source in source_urls or (record.source is None and len(config['sources']) == 1)):
+            results.append((Change.GONE, url, None, None))
+
+    return results
+
 
-def download_all(verbose=False):
+def plan_all(sources=None):
     """
-    Classify sources by scrapers and invoke them.
+    Find out what download_all would do, without downloading files or changing
+    records. Returns a list of (Change, url, expected size or None,
+    description).
     """
+    if sources is None:
+        sources = config['sources']
+
     scrapers = {}
-    for source in config['sources']:
+    for source in sources:
         scrapers.setdefault(source['scraper'], []).append(source)
 
     results = []
     for scraper_name, subsources in scrapers.items():
-        results.extend(download_with_scraper(scraper_name, subsources, verbose=verbose))
-
+        results.extend(plan_with_scraper(scraper_name, subsources))
     return results
 
 
-def check_all():
+def merge_duplicate_records(dry_run=False):
+    """
+    Merge records whose urls are the same after canonicalization, including
+    http and https variants of the same url, without downloading anything.
+
+    The record of a downloaded file (the most recent one) is kept under its
+    canonical url. Files of the other records are left alone.
+
+    Returns:
+        A list of (removed url, kept url, local path of the removed record).
+    """
+    records = config['records']
+    strip_params = {s['source']: s.get('strip_params', ()) for s in config['sources']}
+
+    groups = {}
+    for url, record in records.items():
+        canonical = canonicalize_url(url, strip_params.get(record.source, ()))
+        groups.setdefault(canonical.partition('://')[2], []).append((url, canonical))
+
+    merged = []
+    new_records = {}
+    for group in groups.values():
+        group.sort(
+            key=lambda item: (bool(records[item[0]].local_path), records[item[0]].updated_at or 0),
+            reverse=True)
+        kept_url, canonical = group[0]
+        record = records[kept_url]
+        for url, _ in group[1:]:
+            merged.append((url, canonical, records[url].local_path))
+            if not dry_run:
+                record.discovered_at = min(record.discovered_at, records[url].discovered_at)
+        new_records[canonical] = record
+
+        if not dry_run and canonical != kept_url and record.local_path:
+            try:
+                xattr(record.local_path).set(XATTR_KEY_URL, canonical.encode())
+            except OSError:
+                pass
+
+    if not dry_run:
+        records.clear()
+        records.update(new_records)
+    return merged
+
+
+@metrics.timed('check')
+def check_all(paths=None):
     """
     Detect modifications, movements and deletions of tracked files. This updates
     the corresponding records in the config file.
+
+    Moves are first resolved by matching the (st_dev, st_ino) stored in the
+    records against a single scandir pass, if the size and mtime match as well.
+    Extended attributes are only read as a fallback, e.g. for records without an
+    inode, modified files or files moved across devices.
+
+    If `paths` is given (e.g. as reported by the watcher), only tracked files at
+    or under these paths are checked, and moves are only looked for there.
     """
     records = config['records']
     missing = set()
 
+    # Index of tracked files by (st_dev, st_ino)
+    inodes = {tuple(r.inode): url for url, r in records.items() if r.local_path and r.inode}
+
     def get_xattr_url(local_path, default=None):
         try:
             url = xattr(local_path).get(XATTR_KEY_URL).decode()
@@ -220,50 +649,114 @@ def check_all():
         else:
             return url
 
-    def walk_within_depth():
-        for root, dirs, files in os.walk('.'):
-            # Each `root` string begins with ./
-            if root.count(os.path.sep) > config['depth']:
-                del dirs[:]
-            for f in files:
-                yield os.path.join(root[2:], f)
+    def scan_within_depth(path='.', prefix='', level=0):
+        # Same depth semantics as os.walk pruning at root.count(sep) > depth
+        dev = os.stat(path).st_dev
+        with os.scandir(path) as it:
+            entries = list(it)
+        for entry in entries:
+            if entry.is_dir():
+                if level <= config['depth'] and not entry.is_symlink():
+                    yield from scan_within_depth(
+                        entry.path, os.path.join(prefix, entry.name), level + 1)
+            else:
+                inode = None if entry.is_symlink() else (dev, entry.inode())
+                yield os.path.join(prefix, entry.name), inode
+
+    def scan_paths():
+        for path in sorted(paths):
+            try:
+                stat = os.lstat(path)
+            except FileNotFoundError:
+                continue
+            if S_ISLNK(stat.st_mode):
+                if not os.path.isdir(path):
+                    yield path, None
+            elif S_ISDIR(stat.st_mode):
+                yield from scan_within_depth(path, path, path.count(os.path.sep) + 1)
+            else:
+                yield path, tuple(stat_inode(stat))
+
+    def is_dirty(local_path):
+        if paths is None:
+            return True
+        while local_path:
+            if local_path in paths:
+                return True
+            local_path = os.path.dirname(local_path)
+        return False
 
     def do_move(url, local_path):
         changes.append((url, records[url].local_path, local_path))
         records[url].local_path = local_path
         if not local_path:
             records[url].strategy = Strategy.IGNORE
+            records[url].inode = None
         missing.remove(url)
 
     def check_modified(record, stat):
-        # Check if the file has changed, using mtime then sha1sum
+        # Check if the file has changed, using mtime then sha1sum. The digest is
+        # cached until the stat signature changes.
         record.local_modified = False
+        record.inode = stat_inode(stat)
         if stat.st_mtime > record.updated_at:
-            sha = file_digest(record.local_path)
+            signature = stat_signature(stat)
+            if record.local_sha and record.local_signature == signature:
+                sha = record.local_sha
+            else:
+                sha = file_digest(record.local_path, record.hash_algorithm)
+                record.local_signature = signature
+                record.local_sha = sha
             if sha != record.sha:
                 record.local_modified = True
+        if not record.local_modified:
+            # Remember the signature, e.g. of records tracked before we had
+            # one, so that the file can be followed by inode
+            record.local_signature = stat_signature(stat)
+            record.local_sha = record.sha
+
+    def inspect(url, record):
+        # Runs on the thread pool; only touches its own record
+        try:
+            stat = os.stat(record.local_path)
+        except FileNotFoundError:
+            return None
+
+        inode = tuple(stat_inode(stat))
+        if record.inode and tuple(record.inode) == inode:
+            x_url = url
+        elif inode in inodes and signature_matches(records[inodes[inode]], stat):
+            x_url = inodes[inode]
+        else:
+            # Unknown inode, e.g. replaced by an editor saving atomically
+            x_url = get_xattr_url(record.local_path, url)
+        if x_url == url:
+            check_modified(record, stat)
+        return x_url
 
     # Check all files in our records if
     # 1. They disappeared (deleted or moved somewhere else)
-    # 2. They were replaced by other tracked files (using xattrs)
+    # 2. They were replaced by other tracked files (using inodes, then xattrs)
     checked = set()
-    updated = {}
+    tracked = []
     for url, record in records.items():
         if not record.local_path:
             continue
         checked.add(record.local_path)
-        try:
-            stat = os.stat(record.local_path)
-        except FileNotFoundError:
-            missing.add(url)
-            continue
+        if is_dirty(record.local_path):
+            tracked.append((url, record))
 
-        x_url = get_xattr_url(record.local_path, url)
-        if x_url != url:
-            missing.add(url)
-            updated[x_url] = record.local_path
-        else:
-            check_modified(record, stat)
+    # The per-record syscalls are independent, so overlap them on a thread pool
+    # (this matters on network filesystems). Results are merged in record order.
+    updated = {}
+    with ThreadPoolExecutor(max_workers=CHECK_THREADS) as executor:
+        x_urls = executor.map(lambda item: inspect(*item), tracked)
+        for (url, record), x_url in zip(tracked, x_urls):
+            if x_url is None:
+                missing.add(url)
+            elif x_url != url:
+                missing.add(url)
+                updated[x_url] = record.local_path
 
     changes = []
 
@@ -274,16 +767,28 @@ def check_all():
 
     # Detect movement of tracked files
     if missing:
-        for local_path in walk_within_depth():
-            if local_path in checked:
-                continue
-
-            url = get_xattr_url(local_path)
-            if url and url in missing:
-                do_move(url, local_path)
-
+        with metrics.phase('check scan'):
+            unmatched = []
+            for local_path, inode in scan_within_depth() if paths is None else scan_paths():
+                if local_path in checked:
+                    continue
+
+                url = inodes.get(inode)
+                if url and url in missing and signature_matches(records[url], os.stat(local_path)):
+                    do_move(url, local_path)
+
+                    if not missing:
+                        break
+                else:
+                    unmatched.append(local_path)
+
+            # Fall back to xattrs for files we cannot identify by inode
+            for local_path in unmatched:
                 if not missing:
                     break
+                url = get_xattr_url(local_path)
+                if url and url in missing:
+                    do_move(url, local_path)
 
     # Detect deletion of tracked files
     while missing:
@@ -1,22 +1,38 @@
 import argparse
 from collections import OrderedDict
+import contextlib
 import datetime
 import json
 import os
 import os.path
+import sys
+import textwrap
+import time
+import traceback
 import urllib.parse
 
-from tabulate import tabulate
-from xattr import xattr
-
-from .browser import open_driver
+from .browser import open_driver, shared_driver
 from .config import Record, Status, Strategy, config, config_write, create_config, \
-    get_default_local_config, open_config
+    find_workspaces, get_default_local_config, open_config
+from .cookies import CookieJar
+from .metrics import metrics, print_summary, write_metrics
+from .scheduler import backoff_interval, change_times, estimate_interval, get_daemon_config, \
+    schedule, skip_quiet_hours
 from .scrapers import DEFAULT_SCRAPER
-from .downloader import download_all, check_all, XATTR_KEY_URL
+from .downloader import Change, FilenameAllocator, download_all, check_all, \
+    merge_duplicate_records, plan_all, plan_filename, select_filename, xattr, XATTR_KEY_URL
+from .progress import format_bytes
+from .query import SORT_KEYS, compile_filter, compile_sort, parse_time, query, write_csv, \
+    write_ndjson
+from .renamer import compile_renamers
+from .watcher import pending_paths, watch
 
 
 parser = argparse.ArgumentParser(description='Download lecture materials.')
+parser.add_argument('--profile', action='store_true', help='Print timing and transfer metrics')
+parser.add_argument(
+    '--metrics', metavar='FILE',
+    help='Write metrics as JSON to FILE, or append them as a line if FILE ends with .ndjson')
 subparsers = parser.add_subparsers(dest='mode', title='subcommands')
 
 
@@ -65,7 +81,7 @@ def main_browser(args):
                     elif l == 's':
                         cookies = driver.get_cookies()
                         print('saved {} cookies.'.format(len(cookies)))
-                        config['cookies'].extend(cookies)
+                        config['cookies'] = list(CookieJar(config['cookies']).add(cookies))
             except KeyboardInterrupt:
                 pass
 
@@ -74,10 +90,40 @@ def main_browser(args):
 #######################################################################
 parser_ls = subparsers.add_parser('ls', help='List downloaded files')
 parser_ls.add_argument('--all', '-a', action='store_true', help='List not downloaded files as well')
+parser_ls.add_argument(
+    '--status', action='append', choices=[getattr(Status, s) for s in dir(Status) if s.isupper()],
+    help='Only list files with this last status (repeatable)')
+parser_ls.add_argument(
+    '--strategy', action='append',
+    choices=[getattr(Strategy, s) for s in dir(Strategy) if s.isupper()],
+    help='Only list files with this strategy (repeatable)')
+parser_ls.add_argument(
+    '--type', action='append', dest='content_type', metavar='CONTENT_TYPE',
+    help='Only list files whose content type starts with this, e.g. video/ (repeatable)')
+parser_ls.add_argument(
+    '--host', action='append', help='Only list urls of this host or its subdomains (repeatable)')
+parser_ls.add_argument(
+    '--since', metavar='TIME', help='Only list files updated since TIME, e.g. 7d or 2020-03-01')
+parser_ls.add_argument('--until', metavar='TIME', help='Only list files updated before TIME')
+parser_ls.add_argument(
+    '--modified', action='store_true', default=None, help='Only list locally modified files')
+parser_ls.add_argument(
+    '--sort', metavar='KEYS', type=lambda s: s.split(','),
+    help='Comma-separated sort keys, "-" prefixed for descending: {}'.format(
+        ', '.join(sorted(SORT_KEYS))))
+parser_ls.add_argument('--limit', '-n', type=int, help='List at most this many files')
+parser_ls.add_argument(
+    '--format', choices=['table', 'ndjson', 'csv'], default='table',
+    help='Output format; ndjson and csv are written as files are found')
+
+# Downloaded files by path, then the others by most recent first
+DEFAULT_LS_SORT = ['-downloaded', 'path', '-updated']
 
 def do_check_all():
-    table = [(old, '->', new or 'DELETED', url) for url, old, new in check_all()]
+    changes = check_all(paths=pending_paths())
+    table = [(old, '->', new or 'DELETED', url) for url, old, new in changes]
     if table:
+        from tabulate import tabulate
         print(tabulate(table, tablefmt='plain'))
 
 
@@ -88,34 +134,62 @@ def strftime(timestamp):
         return ''
 
 
+def ls_table_row(link, record):
+    if record.local_path:  # Downloaded
+        filename = record.local_path
+        timestamp = strftime(record.updated_at) + ('*' if record.local_modified else '')
+    else:
+        filename = '[{}]'.format((record.content_type or '?').partition(';')[0])
+        timestamp = strftime(record.updated_at)
+    return (filename, timestamp, record.strategy.upper(), link)
+
+
 def main_ls(args):
-    with open_config():
-        do_check_all()
-        files = []
-        afiles = []
-        for link, record in config['records'].items():
-            if record.local_path:  # Downloaded
-                filename = record.local_path
-                timestamp = (
-                    strftime(record.updated_at) +
-                    ('*' if record.local_modified else ''))
-                strategy = record.strategy.upper()
+    try:
+        predicate = compile_filter(
+            include_all=args.all, status=args.status, strategy=args.strategy,
+            content_type=args.content_type, host=args.host,
+            since=parse_time(args.since) if args.since else None,
+            until=parse_time(args.until) if args.until else None,
+            modified=args.modified)
+        compile_sort(args.sort or [])
+    except ValueError as e:
+        parser_ls.error(str(e))
+    if args.limit is not None and args.limit < 0:
+        parser_ls.error('--limit must not be negative')
 
-                files.append((filename, timestamp, strategy, link))
-            elif args.all and record.strategy != Strategy.AUTO:  # AUTO: file actually existed
-                content_type = '[{}]'.format((record.content_type or '?').partition(';')[0])
-                timestamp = strftime(record.updated_at)
-                strategy = record.strategy.upper()
+    with open_config():
+        if args.format == 'table':
+            do_check_all()
+        else:
+            # Keep the output parseable
+            with contextlib.redirect_stdout(sys.stderr):
+                do_check_all()
+
+        sort = args.sort or (DEFAULT_LS_SORT if args.format == 'table' else None)
+        results = query(config['records'], predicate, sort, args.limit)
+
+        if args.format == 'ndjson':
+            write_ndjson(results, sys.stdout)
+        elif args.format == 'csv':
+            write_csv(results, sys.stdout)
+        else:
+            from tabulate import tabulate
+            print(tabulate(
+                [ls_table_row(link, record) for link, record in results],
+                ['File', 'Updated at', 'Strategy', 'URL'], tablefmt='simple'))
 
-                afiles.append(
-                    (-(record.updated_at or 0), (content_type, timestamp, strategy, link)))
 
-        files.sort()
-        afiles.sort()
-        afiles = [f[1] for f in afiles]
-        files.extend(afiles)
+#######################################################################
+# watch
+#######################################################################
+subparsers.add_parser('watch', help='Watch tracked files to speed up later checks')
 
-        print(tabulate(files, ['File', 'Updated at', 'Strategy', 'URL'], tablefmt='simple'))
+def main_watch(args):
+    with open_config():
+        do_check_all()
+        depth = config['depth']
+    watch(depth)
 
 
 #######################################################################
@@ -134,6 +208,65 @@ def main_mv(args):
         record.local_path = args.target
 
 
+#######################################################################
+# rename
+#######################################################################
+parser_rename = subparsers.add_parser('rename', help='Rename files with the configured renamers')
+parser_rename.add_argument('--dry-run', '-n', action='store_true', help='Only show new names')
+
+def main_rename(args):
+    with open_config():
+        do_check_all()
+        renamer = compile_renamers(config['renamers'])
+
+        table = []
+        allocator = FilenameAllocator()
+        records = sorted(
+            ((url, r) for url, r in config['records'].items() if r.local_path),
+            key=lambda item: item[1].local_path)
+        for url, record in records:
+            filename = select_filename(
+                record.filename or os.path.basename(record.local_path), record.content_type)
+            renamed = plan_filename(filename, url, record.content_type, renamer)
+            if renamed == filename:
+                # Not renamed by the rules, so keep the name the file has
+                continue
+            # The file's own name is free for it, so an existing serial is kept
+            allocator.release(record.local_path)
+            target = allocator.reserve(
+                os.path.join(os.path.dirname(record.local_path), renamed))
+            if target == record.local_path:
+                continue
+            if not args.dry_run:
+                allocator.release(target)
+                target = allocator.create(target)
+                os.replace(record.local_path, target)
+            table.append((record.local_path, '->', target, url))
+            if not args.dry_run:
+                record.local_path = target
+
+        if table:
+            from tabulate import tabulate
+            print(tabulate(table, tablefmt='plain'))
+
+
+#######################################################################
+# dedupe
+#######################################################################
+parser_dedupe = subparsers.add_parser(
+    'dedupe', help='Merge records of the same url, e.g. http and https')
+parser_dedupe.add_argument('--dry-run', '-n', action='store_true', help='Only show merges')
+
+def main_dedupe(args):
+    with open_config():
+        table = [(url, '->', kept, local_path or '')
+                 for url, kept, local_path in merge_duplicate_records(dry_run=args.dry_run)]
+        if table:
+            from tabulate import tabulate
+            print(tabulate(table, tablefmt='plain'))
+        print('{} duplicate records {}'.format(len(table), 'found' if args.dry_run else 'merged'))
+
+
 #######################################################################
 # rm
 #######################################################################
@@ -159,22 +292,175 @@ parser_download = subparsers.add_parser('download', help='Download lecture mater
 parser_download.add_argument('--verbose', '-v', action='store_true')
 parser.set_defaults(verbose=False)
 
+SUMMARY_KEYS = [Status.UPDATED, Status.UP_TO_DATE, Status.SKIPPED, Status.NOT_FOUND, Status.ERROR]
+
+def count_results(results):
+    count = {k: 0 for k in SUMMARY_KEYS}
+    for status, _ in results:
+        count[status] += 1
+    return count
+
+
 def main_download(args):
     with open_config():
         do_check_all()
 
-        KEYS = [Status.UPDATED, Status.UP_TO_DATE, Status.SKIPPED, Status.NOT_FOUND, Status.ERROR]
-        count = {k: 0 for k in KEYS}
+        count = count_results(download_all())
 
-        results = download_all()
-        for status, _ in results:
-            count[status] += 1
+        print(', '.join('{} {}'.format(count[k], k) for k in SUMMARY_KEYS))
 
-        print(', '.join('{} {}'.format(count[k], k) for k in KEYS))
+
+#######################################################################
+# status
+#######################################################################
+parser_status = subparsers.add_parser(
+    'status', help='Show what download would change, without downloading')
+parser_status.add_argument('--verbose', '-v', action='store_true', help='List unchanged files too')
+
+CHANGE_KEYS = [
+    Change.NEW, Change.UPDATED, Change.GONE, Change.UNCHANGED, Change.UNKNOWN, Change.ERROR]
+
+def main_status(args):
+    # Nothing is written back, so records stay as they are
+    with open_config(write=False):
+        changes = plan_all()
+        records = config['records']
+
+        table = []
+        count = {k: 0 for k in CHANGE_KEYS}
+        expected = 0
+        for change, url, size, description in sorted(
+                changes, key=lambda c: (CHANGE_KEYS.index(c[0]), c[1])):
+            count[change] += 1
+            if change in (Change.NEW, Change.UPDATED):
+                expected += size or 0
+            if change != Change.UNCHANGED or args.verbose:
+                record = records.get(url)
+                table.append((
+                    change.upper(), '' if size is None else format_bytes(size),
+                    (record.local_path or '') if record else '', urllib.parse.unquote(url)))
+                if description:
+                    table.append(('', '', '', textwrap.indent(description, '    ')))
+
+        if table:
+            from tabulate import tabulate
+            print(tabulate(table, ['Change', 'Size', 'File', 'URL'], tablefmt='simple'))
+            print()
+        print('{}; {} to download'.format(
+            ', '.join('{} {}'.format(count[k], k) for k in CHANGE_KEYS if count[k]) or 'no files',
+            format_bytes(expected)))
 
 
 #######################################################################
-# download
+# sync-all
+#######################################################################
+parser_sync_all = subparsers.add_parser(
+    'sync-all', help='Download lecture materials for many workspaces')
+parser_sync_all.add_argument(
+    'paths', nargs='*',
+    help='Workspaces or directories to search for them '
+         '(default: "workspaces" in global config, or the current directory)')
+parser_sync_all.add_argument('--list', action='store_true', help='Only list workspaces')
+parser_sync_all.add_argument('--verbose', '-v', action='store_true')
+
+def main_sync_all(args):
+    workspaces = list(find_workspaces(args.paths))
+
+    if args.list:
+        for workspace in workspaces:
+            print(workspace)
+        return
+
+    # Workspaces are synced one after another, since records and local paths
+    # are relative to the current directory, but they share one browser and
+    # one HTTP session.
+    cwd = os.getcwd()
+    table = []
+    with shared_driver():
+        for workspace in workspaces:
+            print('==> {}'.format(workspace))
+            os.chdir(os.path.join(cwd, workspace))
+            try:
+                with open_config():
+                    do_check_all()
+                    count = count_results(download_all(verbose=args.verbose))
+            except Exception:
+                print(traceback.format_exc())
+                table.append([workspace] + ['' for k in SUMMARY_KEYS] + ['failed'])
+                continue
+            finally:
+                os.chdir(cwd)
+            table.append([workspace] + [count[k] for k in SUMMARY_KEYS] + [''])
+
+    totals = [sum(row[i + 1] or 0 for row in table) for i in range(len(SUMMARY_KEYS))]
+    table.append(['(total)'] + totals + [''])
+
+    from tabulate import tabulate
+    print()
+    print(tabulate(table, ['Workspace'] + SUMMARY_KEYS + [''], tablefmt='simple'))
+
+
+#######################################################################
+# daemon
+#######################################################################
+parser_daemon = subparsers.add_parser(
+    'daemon', help='Keep downloading, polling each source as often as it changes')
+parser_daemon.add_argument('--verbose', '-v', action='store_true')
+
+def main_daemon(args):
+    next_runs = {}
+    # Source -> number of failed runs in a row
+    failures = {}
+    try:
+        while True:
+            # Reload the config every time, so that changes made by other
+            # commands in the meantime are kept
+            with open_config():
+                options = get_daemon_config()
+                now = time.time()
+                for source in config['sources']:
+                    # New sources are due right away, unless in quiet hours
+                    if source['source'] not in next_runs:
+                        next_runs[source['source']] = skip_quiet_hours(now, options['quiet_hours'])
+                due = [s for s in config['sources'] if next_runs[s['source']] <= now]
+                if due:
+                    print('[{}] checking {} of {} sources'.format(
+                        strftime(now), len(due), len(config['sources'])))
+                    try:
+                        do_check_all()
+                        count = count_results(download_all(verbose=args.verbose, sources=due))
+                    except Exception:
+                        # Try again later, like a failed cron job would
+                        print(traceback.format_exc())
+                        failed = True
+                    else:
+                        print(', '.join('{} {}'.format(count[k], k) for k in SUMMARY_KEYS))
+                        failed = False
+
+                    now = time.time()
+                    for source in due:
+                        if failed:
+                            failures[source['source']] = failures.get(source['source'], 0) + 1
+                            interval = backoff_interval(failures[source['source']], options)
+                        else:
+                            failures.pop(source['source'], None)
+                            interval = estimate_interval(
+                                change_times(source['source']), now, options)
+                        next_runs[source['source']] = schedule(now, interval, options)
+                        if args.verbose or failed:
+                            print('next check of {} at {}'.format(
+                                source['source'], strftime(next_runs[source['source']])))
+
+                # Also wake up to pick up newly added sources
+                wake = min([next_runs[s['source']] for s in config['sources']] +
+                           [now + options['min_interval']])
+            time.sleep(max(wake - time.time(), 1))
+    except KeyboardInterrupt:
+        pass
+
+
+#######################################################################
+# migrate
 #######################################################################
 parser_migrate = subparsers.add_parser('migrate')
 
@@ -223,7 +509,16 @@ def main(args=None):
     if not args.mode:
         args.mode = 'download'
     # Magical dispatching
-    globals()['main_' + args.mode.replace('-', '_')](args)
+    try:
+        globals()['main_' + args.mode.replace('-', '_')](args)
+    finally:
+        if args.profile or args.metrics:
+            summary = metrics.summary()
+            summary['command'] = args.mode
+            if args.profile:
+                print_summary(summary)
+            if args.metrics:
+                write_metrics(args.metrics, summary)
 
 
 if __name__ == '__main__':
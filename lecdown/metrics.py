@@ -0,0 +1,125 @@
+from contextlib import contextmanager
+import functools
+import json
+import threading
+import time
+
+
+class Metrics:
+    """
+    Collects wall time per phase and per-host HTTP statistics for a run. Phases
+    may nest (e.g. "browser" within "scrape"), and phases running on several
+    threads add up, so phase times do not sum to the total run time.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.phases = {}
+        self.counters = {}
+        self.hosts = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                count, total = self.phases.get(name, (0, 0.0))
+                self.phases[name] = (count + 1, total + elapsed)
+
+    def timed(self, name):
+        """
+        Decorator to time every call of a function as a phase.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.phase(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def request(self, host, seconds, status_code, nbytes):
+        with self.lock:
+            host = self.hosts.setdefault(host, {'latencies': [], 'bytes': 0, 'not_modified': 0})
+            host['latencies'].append(seconds)
+            host['bytes'] += nbytes
+            if status_code == 304:
+                host['not_modified'] += 1
+
+    def summary(self):
+        with self.lock:
+            requests = sum(len(h['latencies']) for h in self.hosts.values())
+            not_modified = sum(h['not_modified'] for h in self.hosts.values())
+            return {
+                'started_at': self.started_at,
+                'seconds': time.time() - self.started_at,
+                'phases': {
+                    name: {'count': count, 'seconds': total}
+                    for name, (count, total) in self.phases.items()},
+                'counters': dict(self.counters),
+                'hosts': {
+                    name: dict(
+                        requests=len(h['latencies']),
+                        bytes=h['bytes'],
+                        not_modified=h['not_modified'],
+                        **{'p{}'.format(p): percentile(h['latencies'], p) for p in (50, 90, 99)})
+                    for name, h in self.hosts.items()},
+                'requests': requests,
+                'bytes': sum(h['bytes'] for h in self.hosts.values()),
+                'not_modified_rate': not_modified / requests if requests else None,
+                }
+
+
+def percentile(values, p):
+    # Nearest-rank percentile
+    values = sorted(values)
+    if not values:
+        return None
+    return values[max(0, -(-len(values) * p // 100) - 1)]
+
+
+def print_summary(summary):
+    from tabulate import tabulate
+
+    print()
+    print(tabulate(
+        sorted(((name, p['count'], '{:.3f}'.format(p['seconds']))
+                for name, p in summary['phases'].items()), key=lambda row: row[0]),
+        ['Phase', 'Count', 'Seconds'], tablefmt='simple'))
+    if summary['hosts']:
+        print()
+        print(tabulate(
+            [(name, h['requests'], h['bytes'], h['not_modified'],
+              '{:.3f}'.format(h['p50']), '{:.3f}'.format(h['p90']), '{:.3f}'.format(h['p99']))
+             for name, h in sorted(summary['hosts'].items())],
+            ['Host', 'Requests', 'Bytes', '304', 'p50', 'p90', 'p99'], tablefmt='simple'))
+    print()
+    rate = summary['not_modified_rate']
+    print('{:.3f}s total, {} requests, {} bytes, {} 304 hit rate'.format(
+        summary['seconds'], summary['requests'], summary['bytes'],
+        '-' if rate is None else '{:.0%}'.format(rate)))
+    for name, value in sorted(summary['counters'].items()):
+        print('{}: {}'.format(name, value))
+
+
+def write_metrics(path, summary):
+    """
+    Write the summary as JSON, or append it as one object per line if `path`
+    ends with .ndjson.
+    """
+    if path.endswith('.ndjson'):
+        with open(path, 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+    else:
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=4)
+
+
+metrics = Metrics()
@@ -0,0 +1,116 @@
+from contextlib import contextmanager
+import sys
+import threading
+import time
+
+
+def format_bytes(n):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n < 1024 or unit == 'GB':
+            return '{:.1f} {}'.format(n, unit) if unit != 'B' else '{} B'.format(int(n))
+        n /= 1024
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return '{}:{:02}:{:02}'.format(hours, minutes, seconds)
+    return '{}:{:02}'.format(minutes, seconds)
+
+
+class Progress:
+    """
+    Live status line for a batch of downloads, showing throughput, files in
+    flight and ETA. Use Progress.print() for other output, which goes above the
+    status line. The status line is only drawn on a terminal.
+
+    `sizes` are the expected sizes of the downloads, or None if unknown.
+    """
+    def __init__(self, sizes, stream=None):
+        self.stream = stream or sys.stdout
+        self.live = self.stream.isatty()
+        self.lock = threading.RLock()
+        self.sizes = sizes
+        self.done = 0
+        self.in_flight = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.drawn_at = 0
+
+    def start(self):
+        with self.lock:
+            self.in_flight += 1
+            self.draw()
+
+    def finish(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.done += 1
+            self.draw()
+
+    def add_bytes(self, n):
+        with self.lock:
+            self.bytes += n
+            # Limit redraws for fast transfers
+            if time.perf_counter() - self.drawn_at > 0.2:
+                self.draw()
+
+    def print(self, *args):
+        with self.lock:
+            self.clear()
+            print(*args, file=self.stream)
+            self.draw()
+
+    def eta(self, rate):
+        known = [s for s in self.sizes if s]
+        average = sum(known) / len(known) if known else (self.bytes / self.done if self.done else 0)
+        remaining = sum(s or average for s in self.sizes) - self.bytes
+        if not rate or self.done == len(self.sizes):
+            return None
+        return max(remaining, 0) / rate
+
+    def status(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.bytes / elapsed if elapsed else 0
+        eta = self.eta(rate)
+        return '[{}/{}] {} in flight, {}, {}/s, ETA {}'.format(
+            self.done, len(self.sizes), self.in_flight, format_bytes(self.bytes),
+            format_bytes(rate), format_duration(eta) if eta is not None else '-')
+
+    def draw(self):
+        if self.live:
+            self.drawn_at = time.perf_counter()
+            self.stream.write('\r\033[K' + self.status())
+            self.stream.flush()
+
+    def clear(self):
+        if self.live:
+            self.stream.write('\r\033[K')
+
+    def close(self):
+        with self.lock:
+            self.clear()
+
+
+# The progress of the downloads running now, for scrapers to report bytes to
+current = {'progress': None}
+
+
+@contextmanager
+def tracking(progress):
+    current['progress'] = progress
+    try:
+        yield progress
+    finally:
+        current['progress'] = None
+        progress.close()
+
+
+def report_bytes(n):
+    """
+    Called by scrapers as they receive data.
+    """
+    progress = current['progress']
+    if progress:
+        progress.add_bytes(n)
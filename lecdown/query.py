@@ -0,0 +1,162 @@
+from collections import OrderedDict
+import csv
+import datetime
+import heapq
+import itertools
+import json
+import re
+import time
+import urllib.parse
+
+from .config import Strategy
+
+
+FIELDS = [
+    'url', 'local_path', 'last_status', 'strategy', 'content_type', 'size',
+    'discovered_at', 'updated_at', 'local_modified', 'source']
+
+SORT_KEYS = {
+    'downloaded': lambda url, record: bool(record.local_path),
+    'path': lambda url, record: record.local_path or '',
+    'url': lambda url, record: url,
+    'status': lambda url, record: record.last_status,
+    'strategy': lambda url, record: record.strategy,
+    'type': lambda url, record: record.content_type or '',
+    'size': lambda url, record: record_size(record) or 0,
+    'discovered': lambda url, record: record.discovered_at or 0,
+    'updated': lambda url, record: record.updated_at or 0,
+}
+
+UNITS = {'m': 60, 'h': 60 * 60, 'd': 24 * 60 * 60, 'w': 7 * 24 * 60 * 60}
+
+RELATIVE_TIME_RE = re.compile(r'^(\d+(?:\.\d+)?)([mhdw])$')
+
+
+def record_size(record):
+    return record.local_signature[0] if record.local_signature else None
+
+
+def parse_time(s, now=None):
+    """
+    Parse a time given as e.g. "7d" ago (units m, h, d or w) or an ISO date
+    such as "2020-03-01" or "2020-03-01T12:00", in local time.
+    """
+    match = RELATIVE_TIME_RE.match(s)
+    if match:
+        return (now or time.time()) - float(match.group(1)) * UNITS[match.group(2)]
+    try:
+        return datetime.datetime.fromisoformat(s).timestamp()
+    except ValueError:
+        raise ValueError('Invalid time "{}"'.format(s))
+
+
+def host_matches(url, host):
+    hostname = urllib.parse.urlsplit(url).hostname or ''
+    return hostname == host or hostname.endswith('.' + host)
+
+
+def compile_filter(include_all=False, status=None, strategy=None, content_type=None, host=None,
+                   since=None, until=None, modified=None):
+    """
+    Returns a predicate of (url, record) for the given filters. Only downloaded
+    records match unless `include_all` is set. `status` and `strategy` are
+    lists of accepted values, `content_type` and `host` lists of prefixes and
+    domains, and `since` and `until` bound updated_at.
+    """
+    checks = []
+    if not include_all:
+        checks.append(lambda url, record: record.local_path)
+    else:
+        # AUTO: the link was never fetched
+        checks.append(lambda url, record: record.local_path or record.strategy != Strategy.AUTO)
+    if status:
+        checks.append(lambda url, record: record.last_status in status)
+    if strategy:
+        checks.append(lambda url, record: record.strategy in strategy)
+    if content_type:
+        prefixes = tuple(content_type)
+        checks.append(lambda url, record: (record.content_type or '').startswith(prefixes))
+    if host:
+        checks.append(lambda url, record: any(host_matches(url, h.lower()) for h in host))
+    if since is not None:
+        checks.append(lambda url, record: record.updated_at and record.updated_at >= since)
+    if until is not None:
+        checks.append(lambda url, record: record.updated_at and record.updated_at < until)
+    if modified is not None:
+        checks.append(lambda url, record: bool(record.local_modified) == modified)
+
+    return lambda url, record: all(check(url, record) for check in checks)
+
+
+class Descending:
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def compile_sort(keys):
+    """
+    Returns a sort key of (url, record) for a list of SORT_KEYS names, each
+    prefixed with "-" for descending order.
+    """
+    funcs = []
+    for key in keys:
+        name = key.lstrip('-')
+        if name not in SORT_KEYS:
+            raise ValueError('Unknown sort key "{}"'.format(name))
+        func = SORT_KEYS[name]
+        if key.startswith('-'):
+            func = (lambda f: lambda url, record: Descending(f(url, record)))(func)
+        funcs.append(func)
+    return lambda item: tuple(func(*item) for func in funcs)
+
+
+def query(records, predicate, sort=None, limit=None):
+    """
+    Yields the (url, record) items of `records` matching `predicate`. Without
+    `sort`, matches are yielded as they are found; with a limit, only the top
+    `limit` items are kept while sorting.
+    """
+    matches = ((url, record) for url, record in records.items() if predicate(url, record))
+    if sort:
+        key = compile_sort(sort)
+        if limit is not None:
+            return iter(heapq.nsmallest(limit, matches, key=key))
+        return iter(sorted(matches, key=key))
+    if limit is not None:
+        return itertools.islice(matches, limit)
+    return matches
+
+
+def record_row(url, record):
+    return OrderedDict([
+        ('url', url),
+        ('local_path', record.local_path),
+        ('last_status', record.last_status),
+        ('strategy', record.strategy),
+        ('content_type', record.content_type),
+        ('size', record_size(record)),
+        ('discovered_at', record.discovered_at),
+        ('updated_at', record.updated_at),
+        ('local_modified', record.local_modified),
+        ('source', record.source),
+        ])
+
+
+def write_ndjson(items, f):
+    for url, record in items:
+        f.write(json.dumps(record_row(url, record)) + '\n')
+
+
+def write_csv(items, f):
+    writer = csv.writer(f)
+    writer.writerow(FIELDS)
+    for url, record in items:
+        writer.writerow(['' if v is None else v for v in record_row(url, record).values()])
@@ -0,0 +1,106 @@
+import functools
+import json
+import os.path
+import re
+import string
+
+
+CLEANUP_RULES = [
+    (re.compile(r'(?i)\b(lecture|lec|l)\s?\b'), ''),
+    (re.compile(r'(?i)\b(tutorial|tut|t)\s?\b'), 'T'),
+    (re.compile(r'(?i)\b(assignment|assgn|asgn|assg|ass)\s?\b'), 'HW'),
+    ]
+
+
+def cleanup_filename(filename):
+    for pattern, replacement in CLEANUP_RULES:
+        filename = pattern.sub(replacement, filename)
+    filename = filename.replace('-', '')
+    if filename.endswith('.pdf'):
+        filename = filename[0].upper() + filename[1:]
+    return filename
+
+
+class Rule:
+    """
+    A renamer rule from the "renamers" config, e.g.
+
+        {"url_prefix": "https://course/hw/", "content_type": "application/pdf",
+         "pattern": "(?P<n>\\d+)", "template": "HW{n}{ext}"}
+
+    A rule applies to files whose URL and content type start with `url_prefix`
+    and `content_type` (if given). Without a template, matches of `pattern` are
+    replaced with `replace`. With a template, the filename is formatted from
+    {filename}, {stem}, {ext} and the named groups of `pattern`, if it matches.
+    `builtin: "cleanup"` applies cleanup_filename.
+    """
+    def __init__(self, pattern=None, replace='', template=None, content_type=None,
+                 url_prefix=None, builtin=None):
+        if builtin not in (None, 'cleanup'):
+            raise ValueError('Unknown builtin renamer "{}"'.format(builtin))
+        self.pattern = re.compile(pattern) if pattern else None
+        self.replace = replace
+        self.template = template
+        if template is not None:
+            fields = {'filename', 'stem', 'ext'} | set(self.pattern.groupindex if pattern else ())
+            for _, field, _, _ in string.Formatter().parse(template):
+                name = re.match(r'[^.\[]*', field).group() if field is not None else None
+                if name is not None and name not in fields:
+                    raise ValueError('Unknown template field "{}"'.format(name))
+        self.content_type = content_type
+        self.url_prefix = url_prefix
+        self.builtin = builtin
+
+    def matches(self, url, content_type):
+        if self.url_prefix and not (url or '').startswith(self.url_prefix):
+            return False
+        if self.content_type and not (content_type or '').startswith(self.content_type):
+            return False
+        return True
+
+    def apply(self, filename):
+        if self.builtin == 'cleanup':
+            filename = cleanup_filename(filename)
+        if self.template is None:
+            if self.pattern:
+                filename = self.pattern.sub(self.replace, filename)
+            return filename
+
+        groups = {}
+        if self.pattern:
+            match = self.pattern.search(filename)
+            if not match:
+                return filename
+            groups = match.groupdict()
+        stem, ext = os.path.splitext(filename)
+        return self.template.format(filename=filename, stem=stem, ext=ext, **groups)
+
+
+class Renamer:
+    def __init__(self, rules):
+        self.rules = rules
+
+    def __call__(self, filename, url=None, content_type=None):
+        for rule in self.rules:
+            if rule.matches(url, content_type):
+                filename = rule.apply(filename)
+        return filename
+
+
+@functools.lru_cache(maxsize=16)
+def compile_rules(rules_json):
+    rules = []
+    for rule in json.loads(rules_json):
+        try:
+            rules.append(Rule(**rule))
+        except (TypeError, ValueError, re.error) as e:
+            raise ValueError('Invalid renamer {}: {}'.format(json.dumps(rule), e))
+    return Renamer(rules)
+
+
+def compile_renamers(rules):
+    """
+    Compile the "renamers" config into a Renamer. Compiled rules are cached, so
+    this is cheap to call repeatedly with the same config.
+    """
+    return compile_rules(json.dumps(rules, sort_keys=True))
@@ -0,0 +1,87 @@
+import base64
+from contextlib import contextmanager
+import queue
+import threading
+import urllib.parse
+
+from .browser import start_driver
+from .metrics import metrics
+
+
+class RendererPool:
+    """
+    A pool of headless browsers to print web pages to PDF. Browsers are started
+    when first needed and reused for later pages until close() is called.
+    """
+    def __init__(self, size=2):
+        self.size = size
+        self.started = 0
+        self.drivers = []
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def session(self):
+        driver = None
+        while driver is None:
+            try:
+                driver = self.idle.get_nowait()
+                break
+            except queue.Empty:
+                pass
+            with self.lock:
+                start = self.started < self.size
+                if start:
+                    self.started += 1
+            if start:
+                try:
+                    driver = start_driver(headless=True)
+                except BaseException:
+                    with self.lock:
+                        self.started -= 1
+                    raise
+                with self.lock:
+                    self.drivers.append(driver)
+            else:
+                try:
+                    driver = self.idle.get(timeout=1)
+                except queue.Empty:
+                    # Check again in case a browser failed to start
+                    pass
+        try:
+            yield driver
+        finally:
+            self.idle.put(driver)
+
+    def render(self, url, save_to, cookies=()):
+        """
+        Print the page at `url` to a PDF file at `save_to`, with `cookies` for
+        that url.
+        """
+        try:
+            from selenium.webdriver.common.print_page_options import PrintOptions
+        except ImportError:
+            raise RuntimeError('Printing pages to PDF requires Selenium 4 or later')
+
+        parsed = urllib.parse.urlparse(url)
+        with self.session() as driver, metrics.phase('render'):
+            if cookies:
+                # Selenium dictates that we go to that domain to set cookie
+                driver.get('{0.scheme}://{0.netloc}/favicon.ico'.format(parsed))
+                for cookie in cookies:
+                    driver.add_cookie(cookie)
+            driver.get(url)
+            pdf = base64.b64decode(driver.print_page(PrintOptions()))
+        with open(save_to, 'xb') as f:
+            f.write(pdf)
+
+    def close(self):
+        with self.lock:
+            drivers, self.drivers = self.drivers, []
+            self.started = 0
+            self.idle = queue.Queue()
+        for driver in drivers:
+            driver.quit()
+
+
+renderers = RendererPool()
@@ -0,0 +1,91 @@
+import datetime
+import random
+
+from .config import config
+
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+DEFAULT_DAEMON_CONFIG = {
+    # Bounds of the polling interval of a source, in seconds
+    'min_interval': HOUR / 2,
+    'max_interval': DAY,
+    # How many times to poll between two expected changes
+    'polls_per_change': 24,
+    # How far back to look for changes, in seconds
+    'history': 28 * DAY,
+    # Random fraction added to or subtracted from each interval
+    'jitter': 0.1,
+    # [start_hour, end_hour] in local time to not poll at all, e.g. [1, 7]
+    'quiet_hours': None,
+}
+
+
+def get_daemon_config():
+    options = dict(DEFAULT_DAEMON_CONFIG)
+    options.update(config.get('daemon') or {})
+    return options
+
+
+def change_times(source):
+    """
+    Times when links of the source were discovered or updated. Records from
+    before sources were tracked count for every source.
+    """
+    times = []
+    for record in config['records'].values():
+        if record.source in (source, None):
+            times.extend(t for t in (record.discovered_at, record.updated_at) if t)
+    return times
+
+
+def estimate_interval(times, now, options):
+    """
+    Estimate how often to poll a source from the times it changed.
+    """
+    # Changes found within an hour (e.g. in the same run) count only once
+    changes = 0
+    last = None
+    for t in sorted(t for t in times if now - options['history'] < t <= now):
+        if last is None or t - last > HOUR:
+            changes += 1
+        last = t
+
+    if not changes:
+        return options['max_interval']
+    interval = options['history'] / changes / options['polls_per_change']
+    return min(max(interval, options['min_interval']), options['max_interval'])
+
+
+def backoff_interval(failures, options):
+    """
+    Interval to poll a source again after it failed `failures` times in a row.
+    """
+    return min(options['min_interval'] * 2 ** (failures - 1), options['max_interval'])
+
+
+def skip_quiet_hours(timestamp, quiet_hours):
+    if not quiet_hours:
+        return timestamp
+    start, end = quiet_hours
+    dt = datetime.datetime.fromtimestamp(timestamp)
+    if start <= end:
+        quiet = start <= dt.hour < end
+    else:
+        quiet = dt.hour >= start or dt.hour < end
+    if not quiet:
+        return timestamp
+    resume = dt.replace(hour=end, minute=0, second=0, microsecond=0)
+    if resume <= dt:
+        resume += datetime.timedelta(days=1)
+    return resume.timestamp()
+
+
+def schedule(now, interval, options):
+    """
+    Returns the time to next poll a source, after `interval` seconds with jitter
+    and outside quiet hours.
+    """
+    jitter = options['jitter'] * (2 * random.random() - 1)
+    return skip_quiet_hours(now + interval * (1 + jitter), options['quiet_hours'])
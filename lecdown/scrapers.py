@@ -1,35 +1,61 @@
 from abc import ABCMeta
-import cgi
 import os.path
+import time
 import urllib.parse
-import requests
 
 from .config import config, Status
+from .cookies import CookieJar
+from .metrics import metrics
+from .progress import report_bytes
+from .urls import canonicalize_url
 from .browser import open_driver
 
 
 DEFAULT_SCRAPER = 'lecdown.scrapers.SeleniumScraper'
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+_session = None
+
+
+def http_session():
+    """
+    Returns a requests session shared by the whole process, so that
+    connections are reused across downloads and workspaces.
+    """
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
 
 class BaseScraper(metaclass=ABCMeta):
     """
     Implement this class and specify the "scraper" option in a source to create
     custom behaviours on collecting and downloading links.
+
+    Scrapers may set `jar` to the CookieJar they download with (e.g. including
+    cookies from logging in), which is then also used to print pages.
     """
     def collect_resources(self, sources, cookies):
         """
-        Collect resource links from the given sources.
+        Collect resource links from the given sources. `cookies` is a CookieJar
+        of the saved cookies.
 
         Returns:
             A list of dicts of the shape
             {'url': 'http://path/to/file',
+             'source': <source page of the link> (optional),
              <other attributes to be used by this scraper>}
         """
 
     def download_file(self, resource, save_to, scraper_attrs=None, force=False):
         """
         Downloads the file for the given resource, if it is thought to be
-        updated. The file should be saved to `save_to`.
+        updated. The file should be saved to `save_to`. Files may be downloaded
+        on several threads at once; call progress.report_bytes() as data
+        arrives to show the download progress.
 
         Returns:
             {'status': Status.{UPDATED | UP_TO_DATE | SKIPPED | ERROR | NOT_FOUND},
@@ -39,26 +65,43 @@ class BaseScraper(metaclass=ABCMeta):
              'scraper_attrs': <scraper-specific attributes saved to record> | None}
         """
 
+    def check_file(self, resource, scraper_attrs=None):
+        """
+        Checks whether the file for the given resource is updated, without
+        downloading it or changing anything. Scrapers that cannot tell return
+        a status of None.
+
+        Returns:
+            {'status': Status.{UPDATED | UP_TO_DATE | NOT_FOUND | ERROR} | None,
+             'description': <readable details on status> | None,
+             'size': <expected size of the download> | None}
+        """
+        return {'status': None}
+
 
 class SeleniumScraper:
     def collect_resources(self, sources, cookies):
+        # Cookies for this run, including those from logging in, which are
+        # also used for downloading
+        self.jar = CookieJar(cookies)
+
         with open_driver() as driver:
-            urls = [s['source'] for s in sources]
-            links = set()
+            source_urls = {canonicalize_url(s['source']) for s in sources}
+            links = {}
 
-            for dest_url in urls:
+            for source in sources:
+                dest_url = source['source']
+                strip_params = source.get('strip_params', ())
                 print('navigating to {}'.format(dest_url))
 
                 parsed = urllib.parse.urlparse(dest_url)
-                cookies = [c for c in cookies if parsed.netloc.endswith(c['domain'])]
-                if cookies:
+                url_cookies = self.jar.for_url(dest_url)
+                if url_cookies:
                     # Selenium dictates that we go to that domain to set cookie
                     driver.get('{0.scheme}://{0.netloc}/favicon.ico'.format(parsed))
-                    for cookie in cookies:
+                    for cookie in url_cookies:
                         driver.add_cookie(cookie)
 
-                self.cookies = {c['name']: c['value'] for c in cookies}
-
                 driver.get(dest_url)
 
                 url = driver.current_url.partition('#')[0]
@@ -86,31 +129,50 @@ class SeleniumScraper:
                         url = driver.current_url.partition('#')[0]
 
                         # Save cookie for downloading
-                        self.cookies.update({c['name']: c['value'] for c in driver.get_cookies()})
+                        self.jar.add(driver.get_cookies())
 
+                page_url = canonicalize_url(url)
                 a_tags = driver.find_elements_by_tag_name('a')
                 for a in a_tags:
                     link = a.get_attribute('href')
                     if not link:
                         continue
-                    link = link.partition('#')[0]
                     # Selenium resolves the link, so it is absolutely absolute
-                    if link == url or link in urls:  # source page
-                        continue
                     if not link.startswith('http://') and not link.startswith('https://'):
                         continue
-                    links.add(link)
+                    # Links are fetched as they are, but deduplicated by
+                    # their canonical form
+                    canonical = canonicalize_url(link, strip_params)
+                    if canonical == page_url or canonical in source_urls:  # source page
+                        continue
+                    links.setdefault(canonical, (link.partition('#')[0], dest_url))
 
-        return [{'url': link} for link in links]
+        return [{'url': link, 'source': source} for link, source in links.values()]
 
     def download_file(self, resource, save_to, scraper_attrs=None, force=False):
+        import cgi
+
         scraper_attrs = scraper_attrs or {'etag': None}
         headers = {}
         # We ignore cache-control policy, and only use the ETag header to
         # validate with server.
         if scraper_attrs.get('etag') and not force:
             headers['If-None-Match'] = scraper_attrs['etag']
-        resp = requests.get(resource['url'], headers=headers, cookies=self.cookies)
+        start = time.perf_counter()
+        resp = http_session().get(
+            resource['url'], headers=headers, cookies=self.jar.values_for_url(resource['url']),
+            stream=True)
+        nbytes = 0
+        with resp:
+            if resp.ok and resp.status_code != 304:
+                with open(save_to, 'xb') as f:
+                    for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        nbytes += len(chunk)
+                        report_bytes(len(chunk))
+        metrics.request(
+            urllib.parse.urlparse(resource['url']).netloc, time.perf_counter() - start,
+            resp.status_code, nbytes)
 
         if not resp.ok:
             if resp.status_code == 404:
@@ -136,10 +198,6 @@ class SeleniumScraper:
                 filename = os.path.basename(path)
                 filename = urllib.parse.unquote(filename) or None
 
-            if resp.status_code != 304:
-                with open(save_to, 'xb') as f:
-                    f.write(resp.content)
-
             scraper_attrs = dict(scraper_attrs)
             scraper_attrs['etag'] = resp.headers.get('ETag')
 
@@ -149,3 +207,39 @@ class SeleniumScraper:
                 'content_type': resp.headers.get('Content-Type'),
                 'scraper_attrs': scraper_attrs
                 }
+
+    def check_file(self, resource, scraper_attrs=None):
+        scraper_attrs = scraper_attrs or {'etag': None}
+        headers = {}
+        if scraper_attrs.get('etag'):
+            headers['If-None-Match'] = scraper_attrs['etag']
+        cookies = self.jar.values_for_url(resource['url'])
+        start = time.perf_counter()
+        resp = http_session().head(
+            resource['url'], headers=headers, cookies=cookies, allow_redirects=True)
+        if resp.status_code in (405, 501):
+            # HEAD is not supported, so only read the headers of a GET
+            with http_session().get(
+                    resource['url'], headers=headers, cookies=cookies, stream=True) as resp:
+                pass
+        metrics.request(
+            urllib.parse.urlparse(resource['url']).netloc, time.perf_counter() - start,
+            resp.status_code, 0)
+
+        if resp.status_code == 404:
+            return {'status': Status.NOT_FOUND}
+        elif not resp.ok:
+            return {
+                'status': Status.ERROR,
+                'description': 'HTTP Error {}'.format(resp.status_code)
+                }
+        # Some servers ignore If-None-Match for HEAD requests
+        elif resp.status_code == 304 or (
+                scraper_attrs.get('etag') and resp.headers.get('ETag') == scraper_attrs['etag']):
+            return {'status': Status.UP_TO_DATE}
+        else:
+            size = resp.headers.get('Content-Length')
+            return {
+                'status': Status.UPDATED,
+                'size': int(size) if size and size.isdigit() else None
+                }
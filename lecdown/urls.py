@@ -0,0 +1,82 @@
+from fnmatch import fnmatchcase
+import posixpath
+import re
+import urllib.parse
+
+
+# Query parameters that never change the resource, removed from every url.
+# Sources can add more with "strip_params", e.g. ["sessionid", "ref_*"].
+DEFAULT_STRIP_PARAMS = ['utm_*', 'fbclid', 'gclid']
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+UNRESERVED = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+
+ESCAPE_RE = re.compile(r'%([0-9a-fA-F]{2})')
+
+
+def normalize_escapes(s, safe):
+    def unescape(match):
+        c = chr(int(match.group(1), 16))
+        return c if c in UNRESERVED else '%' + match.group(1).upper()
+    # Escape what must be escaped, keeping existing escapes
+    return ESCAPE_RE.sub(unescape, urllib.parse.quote(s, safe=safe + '%'))
+
+
+def canonicalize_url(url, strip_params=()):
+    """
+    Returns a canonical form of `url`, so that the same resource is tracked
+    once. The scheme and host are lowercased, the default port, fragment, dot
+    segments and `strip_params` (fnmatch patterns) are removed, percent
+    encoding is normalized and query parameters are sorted by name.
+    """
+    parsed = urllib.parse.urlsplit(url)
+    scheme = parsed.scheme.lower()
+    if scheme not in DEFAULT_PORTS:
+        return url.partition('#')[0]
+
+    try:
+        port = parsed.port
+    except ValueError:
+        # Invalid port, e.g. "http://host:abc/"
+        return url
+    netloc = (parsed.hostname or '').lower()
+    if ':' in netloc:
+        netloc = '[{}]'.format(netloc)
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc += ':{}'.format(port)
+    if parsed.username or parsed.password:
+        netloc = parsed.netloc.rpartition('@')[0] + '@' + netloc
+
+    path = parsed.path
+    if path:
+        trailing = path.endswith(('/', '/.', '/..'))
+        path = posixpath.normpath(path).replace('//', '/')
+        if path == '.':
+            path = '/'
+        if trailing and not path.endswith('/'):
+            path += '/'
+        path = normalize_escapes(path, safe="/:@!$&'()*+,;=")
+
+    params = []
+    for param in parsed.query.split('&'):
+        if not param:
+            continue
+        name = urllib.parse.unquote_plus(param.partition('=')[0])
+        if any(fnmatchcase(name, p) for p in DEFAULT_STRIP_PARAMS + list(strip_params)):
+            continue
+        params.append((name, normalize_escapes(param, safe="/:@!$'()*+,;=?")))
+    # Repeated parameters keep their order, which may be significant
+    params.sort(key=lambda param: param[0])
+    query = '&'.join(param for _, param in params)
+
+    return urllib.parse.urlunsplit((scheme, netloc, path, query, ''))
+
+
+def scheme_variant(url):
+    """
+    Returns `url` with http and https swapped, or None.
+    """
+    scheme, sep, rest = url.partition('://')
+    other = {'http': 'https', 'https': 'http'}.get(scheme)
+    return other + sep + rest if other else None
@@ -0,0 +1,192 @@
+import json
+import os
+import os.path
+import struct
+import sys
+import time
+
+from .config import config
+
+
+# Journal of changed paths, appended to by `lecdown watch`. The first line is a
+# header identifying the watcher session, and each following line is a JSON
+# path relative to the workspace, or null if events were lost.
+EVENTS_FILE = 'lecdown.events'
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | \
+    IN_ONLYDIR
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """
+    Minimal ctypes binding to the Linux inotify API.
+    """
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise RuntimeError('Watching is only supported on Linux')
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            self.raise_errno()
+        # Watch descriptor -> directory path relative to the workspace
+        self.paths = {}
+
+    def raise_errno(self):
+        import ctypes
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path or '.'), WATCH_MASK)
+        if wd < 0:
+            self.raise_errno()
+        self.paths[wd] = path
+
+    def remove_watches(self, path):
+        for wd, p in list(self.paths.items()):
+            if p == path or p.startswith(path + os.path.sep):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.paths[wd]
+
+    def read_events(self):
+        buf = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(buf[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            yield wd, mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch_within_depth(inotify, path, level, depth):
+    # Same depth semantics as the directory scan in check_all
+    dirs = []
+    try:
+        inotify.add_watch(path)
+        if level <= depth:
+            with os.scandir(path or '.') as it:
+                dirs = [e.name for e in it if e.is_dir(follow_symlinks=False)]
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for name in dirs:
+        watch_within_depth(inotify, os.path.join(path, name), level + 1, depth)
+
+
+def watch(depth):
+    """
+    Watch the workspace and append changed paths to the events file until
+    interrupted.
+    """
+    inotify = Inotify()
+    watch_within_depth(inotify, '', 0, depth)
+
+    header = {'pid': os.getpid(), 'session': time.time()}
+    with open(EVENTS_FILE, 'w') as f:
+        f.write(json.dumps(header) + '\n')
+        f.flush()
+        print('Watching {} directories, press Ctrl-C to stop'.format(len(inotify.paths)))
+
+        try:
+            while True:
+                paths = []
+                for wd, mask, name in inotify.read_events():
+                    if mask & IN_Q_OVERFLOW:
+                        paths.append(None)
+                        continue
+                    if mask & IN_IGNORED:
+                        inotify.paths.pop(wd, None)
+                        continue
+                    if wd not in inotify.paths:
+                        continue
+
+                    path = os.path.join(inotify.paths[wd], name)
+                    if path == EVENTS_FILE:
+                        continue
+
+                    if mask & IN_ISDIR:
+                        if mask & (IN_MOVED_FROM | IN_DELETE):
+                            inotify.remove_watches(path)
+                        elif mask & (IN_MOVED_TO | IN_CREATE):
+                            level = path.count(os.path.sep) + 1
+                            if level <= depth + 1:
+                                watch_within_depth(inotify, path, level, depth)
+                    paths.append(path)
+
+                for path in paths:
+                    f.write(json.dumps(path) + '\n')
+                f.flush()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(EVENTS_FILE)
+            inotify.close()
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def pending_paths():
+    """
+    Collect the paths changed since the last check from a running watcher, and
+    mark them as applied in config['watch'].
+
+    Returns:
+        A set of paths, or None if a full check is required.
+    """
+    state = config.pop('watch', None)
+    try:
+        with open(EVENTS_FILE, 'rb') as f:
+            header = json.loads(f.readline().decode())
+            if not is_alive(header['pid']):
+                return None
+
+            if state and state['session'] == header['session']:
+                f.seek(state['offset'])
+                paths = set()
+            else:
+                # The watcher only reports changes from now on
+                f.seek(0, os.SEEK_END)
+                paths = None
+
+            offset = f.tell()
+            data = f.read()
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+    # Ignore a partially written last line
+    data = data[:data.rfind(b'\n') + 1]
+    config['watch'] = {'session': header['session'], 'offset': offset + len(data)}
+
+    if paths is not None:
+        for line in data.splitlines():
+            path = json.loads(line.decode())
+            if path is None:
+                return None
+            paths.add(path)
+    return paths
@@ -0,0 +1,22 @@
+import urllib.request
+
+from benchmarks.__main__ import main_benchmark
+from benchmarks.server import CourseServer
+
+
+def test_course_server():
+    server = CourseServer(files=3, file_size=100).start()
+    try:
+        with urllib.request.urlopen(server.source(0)) as resp:
+            assert resp.read().count(b'<a href="/files/0/') == 3
+        req = urllib.request.Request(server.url + '/files/0/2.pdf', headers={'Range': 'bytes=10-19'})
+        with urllib.request.urlopen(req) as resp:
+            assert resp.status == 206
+            assert len(resp.read()) == 10
+    finally:
+        server.stop()
+
+
+def test_benchmark_smoke(integration_env):
+    results = main_benchmark(['--records', '20', '--files', '5', '--repeat', '1', '--no-save'])
+    assert set(results) >= {'check_all', 'ls', 'download_all_new', 'download_all_unchanged'}
@@ -33,3 +33,15 @@ def test_config_invariance(integration_env):
 
     with open(config.LOCAL_CONFIG_FILE) as f:
         assert f.read() == local_str
+
+
+def test_find_workspaces_home(integration_env, monkeypatch):
+    monkeypatch.setenv('HOME', os.getcwd())
+    os.makedirs(os.path.join('courses', 'a'))
+    config.config_write(os.path.join('courses', 'a', 'lecdown.json'),
+                        config.get_default_local_config())
+    global_obj = config.get_default_global_config()
+    global_obj['workspaces'] = ['~/courses']
+    config.config_write(config.GLOBAL_CONFIG_FILE, global_obj)
+
+    assert list(config.find_workspaces()) == [os.path.join(os.getcwd(), 'courses', 'a')]
@@ -0,0 +1,41 @@
+import time
+
+from lecdown.cookies import CookieJar
+
+
+def cookie(name, domain, path='/', **kwargs):
+    return dict(name=name, value=name + '@' + domain + path, domain=domain, path=path, **kwargs)
+
+
+def test_cookie_jar_dedup_and_expiry():
+    jar = CookieJar([
+        cookie('a', '.example.com'),
+        cookie('a', '.example.com'),
+        cookie('old', 'example.com', expiry=time.time() - 10),
+        ])
+    jar.add([cookie('a', '.example.com', value_extra=1)])
+    assert [c['name'] for c in jar] == ['a']
+    assert list(jar)[0].get('value_extra') == 1
+
+    # An expired cookie removes the saved one
+    jar.add([cookie('a', '.example.com', expiry=time.time() - 10)])
+    assert list(jar) == []
+
+
+def test_cookie_jar_matching():
+    jar = CookieJar([
+        cookie('domain', '.example.com'),
+        cookie('host', 'example.com'),
+        cookie('sub', 'www.example.com', path='/course'),
+        cookie('secure', '.example.com', secure=True),
+        cookie('other', '.other.com'),
+        ])
+    names = lambda url: sorted(c['name'] for c in jar.for_url(url))
+
+    assert names('http://example.com/') == ['domain', 'host']
+    assert names('https://www.example.com/') == ['domain', 'secure']
+    assert names('http://www.example.com/course/notes.pdf') == ['domain', 'sub']
+    assert names('http://www.example.com/courses') == ['domain']
+    assert names('http://notexample.com/') == []
+    assert jar.values_for_url('http://example.com/') == {
+        'domain': 'domain@.example.com/', 'host': 'host@example.com/'}
@@ -1,3 +1,4 @@
+import os
 import time
 import hashlib
 import pytest
@@ -5,7 +6,8 @@ from xattr import xattr
 
 from lecdown.config import LOCAL_CONFIG_FILE, Record, Status, Strategy, config, config_write, \
     get_default_local_config, open_config
-from lecdown.downloader import download_all, check_all,  XATTR_KEY_URL
+from lecdown import downloader
+from lecdown.downloader import FilenameAllocator, download_all, check_all,  XATTR_KEY_URL
 from lecdown.scrapers import BaseScraper
 
 
@@ -20,6 +22,7 @@ class MockScraper(BaseScraper):
     downloads = {}
     sources_collected = set()
     files_downloaded = {}
+    checks = {}
 
     def collect_resources(self, sources, cookies):
         MockScraper.sources_collected.update(s['source'] for s in sources)
@@ -33,16 +36,21 @@ class MockScraper(BaseScraper):
         if 'contents' in entry:
             with open(save_to, 'w') as f:
                 f.write(entry['contents'])
+        if 'raises' in entry:
+            raise entry['raises']
         return self.downloads[url]
 
+    def check_file(self, resource, scraper_attrs=None):
+        return self.checks.get(resource['url'], {'status': None})
 
-def setup(urls=[], downloads={}, records={}):
+
+def setup(urls=[], downloads={}, records={}, source_options={}, checks={}):
     local_obj = get_default_local_config()
     local_obj['sources'] = [
-        {
+        dict({
             'source': 'http://source',
             'scraper': 'test_integration_downloader.MockScraper'
-            }
+            }, **source_options)
         ]
     local_obj['records'].update(records)
     config_write(LOCAL_CONFIG_FILE, local_obj)
@@ -51,6 +59,7 @@ def setup(urls=[], downloads={}, records={}):
     MockScraper.downloads.clear(); MockScraper.downloads.update(downloads)
     MockScraper.sources_collected.clear()
     MockScraper.files_downloaded.clear()
+    MockScraper.checks.clear(); MockScraper.checks.update(checks)
 
 
 def test_download_new_file(integration_env):
@@ -184,3 +193,226 @@ def test_check_replaced_and_modified_file(integration_env):
     assert record2.local_path == 'file'
     assert record2.strategy == Strategy.SYNC
     assert record2.local_modified == True
+
+
+def test_check_moved_file_by_inode(integration_env):
+    with open('file', 'w') as f:
+        f.write('original')
+    stat = os.stat('file')
+    record = Record(
+        last_status=Status.UPDATED, updated_at=time.time()-10,
+        sha=digest('original'),
+        local_path='file', strategy=Strategy.SYNC, inode=[stat.st_dev, stat.st_ino],
+        local_signature=downloader.stat_signature(stat))
+    config['records'].update({'http://file': record})
+
+    # No xattr is set, so only the inode can identify the moved file
+    os.makedirs('sub')
+    os.rename('file', os.path.join('sub', 'file2'))
+
+    changes = check_all()
+    assert changes == [('http://file', 'file', os.path.join('sub', 'file2'))]
+    assert record.local_path == os.path.join('sub', 'file2')
+    assert record.local_modified == False
+    assert record.strategy == Strategy.SYNC
+
+
+def test_check_moved_legacy_file_by_inode(integration_env):
+    with open('file', 'w') as f:
+        f.write('original')
+    # Tracked before inodes and signatures were recorded, and not modified
+    os.utime('file', (time.time()-100, time.time()-100))
+    record = Record(
+        last_status=Status.UPDATED, updated_at=time.time()-10,
+        sha=digest('original'), local_path='file', strategy=Strategy.SYNC)
+    config['records'].update({'http://file': record})
+
+    assert check_all() == []
+    assert record.inode and record.local_signature
+
+    os.rename('file', 'file2')
+    assert check_all() == [('http://file', 'file', 'file2')]
+    assert record.strategy == Strategy.SYNC
+
+
+def test_check_reused_inode(integration_env):
+    with open('file', 'w') as f:
+        f.write('original')
+    stat = os.stat('file')
+    record = Record(
+        last_status=Status.UPDATED, updated_at=time.time()-10,
+        sha=digest('original'),
+        local_path='file', strategy=Strategy.SYNC, inode=[stat.st_dev, stat.st_ino],
+        local_signature=downloader.stat_signature(stat))
+    config['records'].update({'http://file': record})
+
+    # An unrelated file that got the inode of the deleted file
+    os.unlink('file')
+    with open('notes', 'w') as f:
+        f.write('my own notes')
+    record.inode = downloader.stat_inode(os.stat('notes'))
+
+    changes = check_all()
+    assert changes == [('http://file', 'file', None)]
+    assert record.local_path is None
+
+
+def test_check_many_files(integration_env):
+    records = {}
+    for i in range(50):
+        name = 'file{}'.format(i)
+        with open(name, 'w') as f:
+            f.write('changed' if i % 3 == 0 else 'original')
+        records['http://' + name] = Record(
+            last_status=Status.UPDATED, updated_at=time.time()-10,
+            sha=digest('original'),
+            local_path=name, strategy=Strategy.SYNC)
+    config['records'].update(records)
+    os.unlink('file7')
+
+    changes = check_all()
+    assert changes == [('http://file7', 'file7', None)]
+    for i in range(50):
+        assert records['http://file{}'.format(i)].local_modified == (i % 3 == 0 and i != 7)
+
+
+def test_check_modified_file_digest_cached(integration_env, monkeypatch):
+    record = Record(
+        last_status=Status.UPDATED, updated_at=time.time()-10,
+        sha=digest('original'),
+        local_path='file', strategy=Strategy.SYNC)
+    config['records'].update({'http://file': record})
+    with open('file', 'w') as f:
+        f.write('changed')
+
+    check_all()
+    assert record.local_modified == True
+    assert record.local_sha == digest('changed')
+
+    def fail(*args):
+        raise AssertionError('file should not be hashed again')
+    monkeypatch.setattr(downloader, 'file_digest', fail)
+    check_all()
+    assert record.local_modified == True
+
+
+def test_download_new_file_with_hash_algorithm(integration_env):
+    setup(
+        urls=['http://new_file'],
+        downloads={'http://new_file': {'status': Status.UPDATED, 'contents': 'new_file'}})
+
+    with open_config():
+        config['hash'] = 'blake2b'
+        download_all()
+        record = config['records']['http://new_file']
+        assert record.hash_algorithm == 'blake2b'
+        assert record.sha == hashlib.blake2b(b'new_file').hexdigest()
+
+        # Force a rehash; the file is still unmodified
+        record.updated_at -= 10
+        record.local_signature = None
+        check_all()
+        assert record.local_modified == False
+
+
+def test_download_new_file_renamed(integration_env):
+    setup(
+        urls=['http://course/lec_1'],
+        downloads={'http://course/lec_1': {
+            'status': Status.UPDATED, 'contents': 'lec', 'filename': 'lec_1.pdf'}})
+
+    with open_config():
+        config['renamers'] = [{'url_prefix': 'http://course/', 'template': 'Course {filename}'}]
+        download_all()
+        assert config['records']['http://course/lec_1'].local_path == 'Course lec_1.pdf'
+
+
+def test_filename_allocator(integration_env):
+    for name in ['notes.pdf', 'notes.0.pdf']:
+        with open(name, 'w') as f:
+            f.write(name)
+    allocator = FilenameAllocator()
+
+    assert allocator.reserve('new.pdf') == 'new.pdf'
+    assert allocator.reserve('new.pdf') == 'new.0.pdf'
+    assert [allocator.reserve('notes.pdf') for _ in range(3)] == \
+        ['notes.1.pdf', 'notes.2.pdf', 'notes.3.pdf']
+
+    # Created by someone else after the directory was listed
+    with open('other.pdf', 'w') as f:
+        f.write('other')
+    assert allocator.create('other.pdf') == 'other.0.pdf'
+    assert os.path.exists('other.0.pdf')
+    with open('other.pdf') as f:
+        assert f.read() == 'other'
+
+    allocator.release('new.pdf')
+    assert allocator.reserve('new.pdf') == 'new.pdf'
+
+
+def test_download_canonical_url(integration_env):
+    setup(
+        urls=['https://file/./notes.pdf?utm_source=x#top', 'https://file/notes.pdf',
+              'http://file/f?a=1&b=2'],
+        downloads={
+            'https://file/./notes.pdf?utm_source=x': {'status': Status.UP_TO_DATE},
+            'http://file/f?a=1&b=2': {'status': Status.UP_TO_DATE},
+            },
+        records={
+            'http://file/notes.pdf': Record(
+                last_status=Status.UPDATED, updated_at=time.time()-10,
+                local_path=None, strategy=Strategy.SYNC),
+            # Tracked before urls were canonicalized
+            'http://file/f?b=2&a=1': Record(
+                last_status=Status.UPDATED, updated_at=time.time()-10,
+                local_path=None, strategy=Strategy.SYNC),
+            })
+
+    with open_config():
+        # Both links are the record tracked through http, and fetched once
+        # through the url the page links
+        assert download_all() == [(Status.UP_TO_DATE, None), (Status.UP_TO_DATE, None)]
+        assert list(config['records']) == ['http://file/notes.pdf', 'http://file/f?b=2&a=1']
+    assert sorted(MockScraper.files_downloaded) == \
+        ['http://file/f?a=1&b=2', 'https://file/./notes.pdf?utm_source=x']
+
+
+def test_download_priority(integration_env, monkeypatch):
+    monkeypatch.setitem(downloader.DEFAULT_DOWNLOAD_CONFIG, 'threads', 1)
+    now = time.time()
+    downloads = {u: {'status': Status.UP_TO_DATE} for u in ['http://big', 'http://small', 'http://changing']}
+    downloads['http://new'] = {'status': Status.UPDATED, 'contents': 'new'}
+    setup(
+        urls=['http://big', 'http://small', 'http://changing', 'http://new'],
+        downloads=downloads,
+        records={
+            'http://big': Record(
+                discovered_at=now-10, updated_at=now-10, local_signature=[1000, 0, 0, 0],
+                strategy=Strategy.SYNC),
+            'http://small': Record(
+                discovered_at=now-10, updated_at=now-10, local_signature=[10, 0, 0, 0],
+                strategy=Strategy.SYNC),
+            'http://changing': Record(
+                discovered_at=now-86400, updated_at=now-10, local_signature=[5000, 0, 0, 0],
+                strategy=Strategy.SYNC),
+            })
+
+    with open_config():
+        download_all()
+
+    assert list(MockScraper.files_downloaded) == \
+        ['http://new', 'http://changing', 'http://small', 'http://big']
+
+
+def test_download_failed_midway(integration_env):
+    setup(
+        urls=['http://notes.pdf'],
+        downloads={'http://notes.pdf': {
+            'status': Status.UPDATED, 'contents': 'partial', 'raises': IOError('reset')}})
+
+    for i in range(3):
+        with open_config():
+            [(status, _)] = download_all()
+            assert status == Status.ERROR
+    # No partial downloads are left behind
+    assert not [f for f in os.listdir('.') if f.endswith('.download')]
@@ -0,0 +1,34 @@
+import json
+
+from lecdown.config import Status
+from lecdown.main import main
+from lecdown.metrics import Metrics
+
+from test_integration_downloader import setup
+
+
+def test_metrics(integration_env):
+    setup(
+        urls=['http://new_file'],
+        downloads={'http://new_file': {'status': Status.UPDATED, 'contents': 'new_file'}})
+
+    main(['--profile', '--metrics', 'metrics.ndjson', 'download'])
+    main(['--metrics', 'metrics.ndjson', 'ls'])
+
+    with open('metrics.ndjson') as f:
+        download, ls = [json.loads(line) for line in f]
+    assert download['command'] == 'download'
+    assert {'check', 'scrape', 'download', 'download file', 'hash'} <= set(download['phases'])
+    assert download['counters']['hashed bytes'] >= len('new_file')
+    assert ls['command'] == 'ls'
+
+
+def test_metrics_hosts():
+    m = Metrics()
+    for i in range(10):
+        m.request('host', i / 10, 304 if i < 3 else 200, 100)
+    summary = m.summary()
+    assert summary['hosts']['host']['p50'] == 0.4
+    assert summary['hosts']['host']['p99'] == 0.9
+    assert summary['bytes'] == 1000
+    assert summary['not_modified_rate'] == 0.3
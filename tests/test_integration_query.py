@@ -0,0 +1,66 @@
+import json
+import time
+
+import pytest
+
+from lecdown import config as config_module
+from lecdown.config import Record, Status, Strategy, config_write, get_default_local_config
+from lecdown.main import main
+from lecdown.query import compile_filter, parse_time, query
+
+
+def make_records(now):
+    return {
+        'http://a.example.com/1.pdf': Record(
+            local_path='1.pdf', last_status=Status.UPDATED, strategy=Strategy.SYNC,
+            content_type='application/pdf', updated_at=now - 3600, local_signature=[30, 0, 0, 0]),
+        'http://b.example.com/2.mp4': Record(
+            local_path='2.mp4', last_status=Status.ERROR, strategy=Strategy.SYNC,
+            content_type='video/mp4', updated_at=now - 30 * 86400, local_modified=True,
+            local_signature=[2000, 0, 0, 0]),
+        'http://other.com/page': Record(
+            last_status=Status.UP_TO_DATE, strategy=Strategy.IGNORE,
+            content_type='text/html', updated_at=now - 86400),
+        'http://other.com/never': Record(),
+        }
+
+
+def urls(items):
+    return [url for url, _ in items]
+
+
+def test_query():
+    now = time.time()
+    records = make_records(now)
+
+    assert urls(query(records, compile_filter())) == \
+        ['http://a.example.com/1.pdf', 'http://b.example.com/2.mp4']
+    assert urls(query(records, compile_filter(include_all=True), sort=['-updated'])) == \
+        ['http://a.example.com/1.pdf', 'http://other.com/page', 'http://b.example.com/2.mp4']
+    assert urls(query(records, compile_filter(since=parse_time('7d', now)))) == \
+        ['http://a.example.com/1.pdf']
+    assert urls(query(records, compile_filter(status=[Status.ERROR], host=['example.com']))) == \
+        ['http://b.example.com/2.mp4']
+    assert urls(query(records, compile_filter(include_all=True, content_type=['text/']))) == \
+        ['http://other.com/page']
+    assert urls(query(records, compile_filter(modified=True))) == ['http://b.example.com/2.mp4']
+    assert urls(query(records, compile_filter(), sort=['-size', 'url'], limit=1)) == \
+        ['http://b.example.com/2.mp4']
+
+
+def test_ls_ndjson(integration_env, capsys):
+    local_obj = get_default_local_config()
+    local_obj['records'].update(make_records(time.time()))
+    for record in local_obj['records'].values():
+        record.local_path = None
+    config_write(config_module.LOCAL_CONFIG_FILE, local_obj)
+
+    main(['ls', '--all', '--format', 'ndjson', '--strategy', 'ignore'])
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(row['url'], row['content_type']) for row in rows] == \
+        [('http://other.com/page', 'text/html')]
+
+
+def test_ls_negative_limit(integration_env):
+    with pytest.raises(SystemExit):
+        main(['ls', '--format', 'ndjson', '-n', '-1'])
@@ -0,0 +1,77 @@
+import pytest
+
+from lecdown import config as config_module
+from lecdown.config import Record, Status, Strategy, config, config_write, \
+    get_default_global_config, get_default_local_config, open_config
+from lecdown.main import main
+from lecdown.renamer import cleanup_filename, compile_renamers
+
+
+def test_renamer_rules():
+    renamer = compile_renamers([
+        {'pattern': r'_', 'replace': ' '},
+        {'url_prefix': 'http://course/hw/', 'pattern': r'(?P<n>\d+)', 'template': 'HW{n}{ext}'},
+        {'content_type': 'video/', 'template': '[video] {filename}'},
+        ])
+    assert renamer('lec_01.pdf', 'http://course/notes/lec_01.pdf', 'application/pdf') == \
+        'lec 01.pdf'
+    assert renamer('ex_3.pdf', 'http://course/hw/ex_3.pdf', 'application/pdf') == 'HW3.pdf'
+    assert renamer('lec.mp4', 'http://course/lec.mp4', 'video/mp4') == '[video] lec.mp4'
+
+    # Compiled rules are reused
+    assert compile_renamers([{'pattern': r'_', 'replace': ' '}]) is \
+        compile_renamers([{'replace': ' ', 'pattern': r'_'}])
+
+
+def test_renamer_builtin_and_errors():
+    renamer = compile_renamers([{'builtin': 'cleanup'}])
+    assert renamer('lecture-notes.pdf') == cleanup_filename('lecture-notes.pdf')
+    with pytest.raises(ValueError):
+        compile_renamers([{'pattern': '('}])
+    with pytest.raises(ValueError):
+        compile_renamers([{'bogus': 1}])
+    with pytest.raises(ValueError):
+        compile_renamers([{'pattern': r'(?P<n>\d+)', 'template': 'HW{nmae}{ext}'}])
+    with pytest.raises(ValueError):
+        compile_renamers([{'template': '{0}'}])
+    with pytest.raises(ValueError):
+        compile_renamers([{'template': '{stem'}])
+
+
+@pytest.mark.parametrize('dry_run', [True, False])
+def test_rename(integration_env, dry_run):
+    for name in ['a_1.pdf', 'a 1.pdf', 'my notes.pdf']:
+        with open(name, 'w') as f:
+            f.write(name)
+    records = {
+        'http://a_1': Record(
+            last_status=Status.UPDATED, updated_at=0, filename='a_1.pdf',
+            local_path='a_1.pdf', strategy=Strategy.SYNC),
+        'http://a 1': Record(
+            last_status=Status.UPDATED, updated_at=0, filename='a 1.pdf',
+            local_path='a 1.pdf', strategy=Strategy.SYNC),
+        # Renamed by the user, but not by the rules
+        'http://x': Record(
+            last_status=Status.UPDATED, updated_at=0, filename='x.pdf',
+            local_path='my notes.pdf', strategy=Strategy.SYNC),
+        }
+    local_obj = get_default_local_config()
+    local_obj['records'].update(records)
+    config_write(config_module.LOCAL_CONFIG_FILE, local_obj)
+    global_obj = get_default_global_config()
+    global_obj['renamers'] = [{'pattern': '_', 'replace': ' '}]
+    config_write(config_module.GLOBAL_CONFIG_FILE, global_obj)
+
+    main(['rename'] + (['--dry-run'] if dry_run else []))
+    # Renaming again changes nothing
+    main(['rename'] + (['--dry-run'] if dry_run else []))
+
+    with open_config():
+        if dry_run:
+            assert config['records']['http://a_1'].local_path == 'a_1.pdf'
+        else:
+            assert config['records']['http://a_1'].local_path == 'a 1.0.pdf'
+            with open('a 1.0.pdf') as f:
+                assert f.read() == 'a_1.pdf'
+        assert config['records']['http://a 1'].local_path == 'a 1.pdf'
+        assert config['records']['http://x'].local_path == 'my notes.pdf'
@@ -0,0 +1,85 @@
+import pytest
+
+from lecdown import downloader, renderer
+from lecdown.config import Record, Status, Strategy, config, open_config
+from lecdown.cookies import CookieJar
+from lecdown.downloader import download_all
+
+from test_integration_downloader import MockScraper, setup
+
+
+def test_print_html(integration_env, monkeypatch):
+    rendered = []
+    def render(url, save_to, cookies=()):
+        rendered.append(url)
+        assert [c['name'] for c in cookies] == ['login']
+        with open(save_to, 'w') as f:
+            f.write('pdf of ' + url)
+    monkeypatch.setattr(downloader.renderers, 'render', render)
+    # Cookies of the scraper, e.g. from logging in
+    monkeypatch.setattr(
+        MockScraper, 'jar', CookieJar([{'domain': 'wiki', 'name': 'login', 'value': '1'}]),
+        raising=False)
+
+    page = {'status': Status.UPDATED, 'contents': '<html>', 'filename': 'wiki.html',
+            'content_type': 'text/html'}
+    setup(urls=['http://wiki'], downloads={'http://wiki': page},
+          source_options={'print_html': True})
+
+    with open_config():
+        assert download_all() == [(Status.UPDATED, None)]
+        record = config['records']['http://wiki']
+        assert record.strategy == Strategy.PRINT
+        assert record.local_path == 'wiki.pdf'
+        assert record.content_type == 'application/pdf'
+    with open('wiki.pdf') as f:
+        assert f.read() == 'pdf of http://wiki'
+
+    # Same page without a validator: not rendered again
+    with open_config():
+        assert download_all() == [(Status.UP_TO_DATE, None)]
+    assert rendered == ['http://wiki']
+
+    page['contents'] = '<html>changed'
+    with open_config():
+        assert download_all() == [(Status.UPDATED, None)]
+    assert rendered == ['http://wiki', 'http://wiki']
+
+
+def test_print_html_ignored_page(integration_env, monkeypatch):
+    def render(url, save_to, cookies=()):
+        with open(save_to, 'w') as f:
+            f.write('pdf of ' + url)
+    monkeypatch.setattr(downloader.renderers, 'render', render)
+
+    page = {'status': Status.UPDATED, 'contents': '<html>', 'filename': 'wiki.html',
+            'content_type': 'text/html'}
+    setup(urls=['http://wiki', 'http://removed'],
+          downloads={'http://wiki': page, 'http://removed': page},
+          records={
+              # Ignored automatically before print_html was set
+              'http://wiki': Record(
+                  strategy=Strategy.IGNORE, filename='wiki.html', content_type='text/html'),
+              # Removed by the user
+              'http://removed': Record(
+                  last_status=Status.UPDATED, strategy=Strategy.IGNORE, content_type='text/html'),
+              },
+          source_options={'print_html': True})
+
+    with open_config():
+        assert download_all() == [(Status.UPDATED, None), (Status.SKIPPED, None)]
+        assert config['records']['http://wiki'].strategy == Strategy.PRINT
+        assert config['records']['http://wiki'].local_path == 'wiki.pdf'
+
+
+def test_renderer_pool_failed_start(monkeypatch):
+    def start_driver(headless=False):
+        raise RuntimeError('Chrome failed to start')
+    monkeypatch.setattr(renderer, 'start_driver', start_driver)
+
+    pool = renderer.RendererPool(size=2)
+    for i in range(3):
+        with pytest.raises(RuntimeError):
+            with pool.session():
+                pass
+    assert pool.started == 0
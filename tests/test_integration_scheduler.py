@@ -0,0 +1,76 @@
+import datetime
+
+from lecdown import config as config_module, main as main_module
+from lecdown.config import Record, config, config_write, get_default_local_config
+from lecdown.main import main
+from lecdown.scheduler import DAY, DEFAULT_DAEMON_CONFIG, HOUR, backoff_interval, change_times, \
+    estimate_interval, schedule, skip_quiet_hours
+
+
+def test_estimate_interval():
+    options = dict(DEFAULT_DAEMON_CONFIG)
+    now = 100 * DAY
+
+    # Static page
+    assert estimate_interval([], now, options) == options['max_interval']
+    assert estimate_interval([now - 60 * DAY], now, options) == options['max_interval']
+
+    # Weekly changes, each with a few files
+    weekly = [now - w * 7 * DAY + m * 60 for w in range(4) for m in range(3)]
+    assert estimate_interval(weekly, now, options) == 7 * DAY / 24
+
+    # Busy page
+    hourly = [now - h * 2 * HOUR for h in range(100)]
+    assert estimate_interval(hourly, now, options) == options['min_interval']
+
+
+def test_change_times(integration_env):
+    config['records'].update({
+        'http://a': Record(source='http://source', discovered_at=1, updated_at=2),
+        'http://b': Record(source='http://other', discovered_at=3, updated_at=None),
+        'http://c': Record(discovered_at=4, updated_at=5),
+        })
+    assert sorted(change_times('http://source')) == [1, 2, 4, 5]
+
+
+def test_schedule_quiet_hours():
+    options = dict(DEFAULT_DAEMON_CONFIG, jitter=0, quiet_hours=[23, 7])
+    night = datetime.datetime(2020, 1, 1, 22, 30).timestamp()
+    morning = datetime.datetime(2020, 1, 2, 7, 0).timestamp()
+    assert schedule(night, HOUR, options) == morning
+    assert schedule(night, HOUR / 4, options) == night + HOUR / 4
+
+    day = datetime.datetime(2020, 1, 2, 12, 0).timestamp()
+    assert skip_quiet_hours(day, [1, 7]) == day
+    assert skip_quiet_hours(day, [12, 13]) == datetime.datetime(2020, 1, 2, 13, 0).timestamp()
+
+
+def test_daemon_errors(integration_env, monkeypatch, capsys):
+    local_obj = get_default_local_config()
+    local_obj['sources'] = [
+        {'source': 'http://source', 'scraper': 'lecdown.scrapers.SeleniumScraper'}]
+    config_write(config_module.LOCAL_CONFIG_FILE, local_obj)
+
+    runs = []
+    def download_all(verbose=False, sources=None):
+        runs.append(sources)
+        raise RuntimeError('page load failed')
+    monkeypatch.setattr(main_module, 'download_all', download_all)
+
+    sleeps = []
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            raise KeyboardInterrupt
+    monkeypatch.setattr(main_module.time, 'sleep', sleep)
+
+    main(['daemon'])
+    assert 'page load failed' in capsys.readouterr().out
+    # Tried once, then backed off
+    assert len(runs) == 1
+    options = DEFAULT_DAEMON_CONFIG
+    assert sleeps[0] > options['min_interval'] * (1 - options['jitter']) - 10
+
+    assert backoff_interval(1, options) == options['min_interval']
+    assert backoff_interval(3, options) == options['min_interval'] * 4
+    assert backoff_interval(100, options) == options['max_interval']
@@ -0,0 +1,31 @@
+import os.path
+import subprocess
+import sys
+
+
+# Modules only needed by subcommands that touch the network or print tables
+LAZY_MODULES = ['selenium', 'requests', 'tabulate', 'xattr', 'cffi', 'cgi', 'ctypes']
+
+# Upper bound on the cumulative import time of lecdown.main, in microseconds.
+# It takes around 20ms without the lazy modules.
+IMPORT_TIME_BUDGET = 150000
+
+
+def import_times():
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import lecdown.main'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        _, _, fields = line.partition(':')
+        _, cumulative, name = fields.split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_is_fast():
+    times = import_times()
+    assert [m for m in LAZY_MODULES if m in times] == []
+    assert times['lecdown.main'] < IMPORT_TIME_BUDGET
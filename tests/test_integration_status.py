@@ -0,0 +1,36 @@
+import time
+
+from lecdown.config import LOCAL_CONFIG_FILE, Record, Status, Strategy
+from lecdown.main import main
+
+from test_integration_downloader import MockScraper, setup
+
+
+def test_status(integration_env, capsys):
+    records = {
+        url: Record(last_status=Status.UPDATED, updated_at=time.time()-10,
+                    local_path=url.rpartition('/')[2], strategy=Strategy.SYNC,
+                    source='http://source')
+        for url in ['http://changed', 'http://same', 'http://removed', 'http://deleted']}
+    setup(
+        urls=['http://new', 'http://changed', 'http://same', 'http://removed', 'http://other'],
+        records=records,
+        checks={
+            'http://new': {'status': Status.UPDATED, 'size': 1000},
+            'http://changed': {'status': Status.UPDATED, 'size': 24},
+            'http://same': {'status': Status.UP_TO_DATE},
+            'http://removed': {'status': Status.NOT_FOUND},
+            'http://other': {'status': Status.SKIPPED},
+            })
+    with open(LOCAL_CONFIG_FILE) as f:
+        local_config = f.read()
+
+    main(['status'])
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[0] for line in lines[-7:-2]] == \
+        ['NEW', 'UPDATED', 'GONE', 'GONE', 'UNKNOWN']
+    assert lines[-1] == '1 new, 1 updated, 2 gone, 1 unchanged, 1 unknown; 1.0 KB to download'
+
+    assert MockScraper.files_downloaded == {}
+    with open(LOCAL_CONFIG_FILE) as f:
+        assert f.read() == local_config
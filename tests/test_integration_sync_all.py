@@ -0,0 +1,27 @@
+import os
+import shutil
+
+from lecdown import config as config_module
+from lecdown.config import LOCAL_CONFIG_FILE, Status
+from lecdown.main import main
+
+from test_integration_downloader import setup
+
+
+def test_sync_all(integration_env, monkeypatch, capsys):
+    monkeypatch.setattr(config_module, 'LOCAL_CONFIG_FILE', 'lecdown.json')
+    setup(
+        urls=['http://new_file'],
+        downloads={'http://new_file': {'status': Status.UPDATED, 'contents': 'new_file'}})
+    for workspace in ['a', os.path.join('b', 'c')]:
+        os.makedirs(workspace)
+        shutil.copy(LOCAL_CONFIG_FILE, workspace)
+    os.unlink(LOCAL_CONFIG_FILE)
+
+    main(['sync-all', '--list'])
+    assert capsys.readouterr().out.split() == ['./a', './b/c']
+
+    main(['sync-all'])
+    for workspace in ['a', os.path.join('b', 'c')]:
+        with open(os.path.join(workspace, 'new_file')) as f:
+            assert f.read() == 'new_file'
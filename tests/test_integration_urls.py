@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+import time
+
+from lecdown import scrapers
+from lecdown.config import Record, Status, Strategy, config
+from lecdown.downloader import merge_duplicate_records
+from lecdown.urls import canonicalize_url
+
+
+def test_canonicalize_url():
+    assert canonicalize_url('HTTP://Example.COM:80/a/./b/../c.pdf#top') == \
+        'http://example.com/a/c.pdf'
+    assert canonicalize_url('https://example.com:8443/%7euser/%2fnotes%41.pdf') == \
+        'https://example.com:8443/~user/%2FnotesA.pdf'
+    assert canonicalize_url('http://example.com/a b/é.pdf') == \
+        'http://example.com/a%20b/%C3%A9.pdf'
+    assert canonicalize_url('http://example.com/dir/') == 'http://example.com/dir/'
+    assert canonicalize_url('http://example.com/f?b=2&a=1&utm_source=mail&fbclid=x') == \
+        'http://example.com/f?a=1&b=2'
+    assert canonicalize_url('http://example.com/f?sid=1&id=2', strip_params=['sid']) == \
+        'http://example.com/f?id=2'
+    assert canonicalize_url('ftp://Example.com/f#x') == 'ftp://Example.com/f'
+    assert canonicalize_url('http://a:abc/x#y') == 'http://a:abc/x#y'
+    assert canonicalize_url('http://example.com/f?q=a+b&p=1&q=%20') == \
+        'http://example.com/f?p=1&q=a+b&q=%20'
+
+
+def test_merge_duplicate_records(integration_env):
+    def record(local_path=None, updated_at=None, discovered_at=None):
+        return Record(
+            last_status=Status.UPDATED, discovered_at=discovered_at or time.time(),
+            updated_at=updated_at, local_path=local_path, strategy=Strategy.SYNC)
+    config['sources'] = [{'source': 'http://course', 'scraper': 'x', 'strip_params': ['sid']}]
+    config['records'].update({
+        'http://example.com/a.pdf': record(discovered_at=1),
+        'https://example.com/./a.pdf': record(local_path='a.pdf', updated_at=10),
+        'http://example.com/b.pdf?sid=1': Record(source='http://course'),
+        'http://example.com/b.pdf?sid=2': Record(source='http://course'),
+        'http://example.com/c.pdf': record(),
+        })
+
+    assert len(merge_duplicate_records(dry_run=True)) == 2
+    assert len(config['records']) == 5
+
+    merged = merge_duplicate_records()
+    assert ('http://example.com/a.pdf', 'https://example.com/a.pdf', None) in merged
+    assert sorted(config['records']) == [
+        'http://example.com/b.pdf', 'http://example.com/c.pdf', 'https://example.com/a.pdf']
+    kept = config['records']['https://example.com/a.pdf']
+    assert kept.local_path == 'a.pdf'
+    assert kept.discovered_at == 1
+
+
+class MockElement:
+    def __init__(self, href):
+        self.href = href
+
+    def get_attribute(self, name):
+        return self.href
+
+
+class MockDriver:
+    def __init__(self, hrefs):
+        self.hrefs = hrefs
+        self.current_url = None
+
+    def get(self, url):
+        self.current_url = url
+
+    def find_elements_by_tag_name(self, name):
+        return [MockElement(href) for href in self.hrefs]
+
+
+def test_collect_resources_raw_links(integration_env, monkeypatch):
+    driver = MockDriver([
+        'http://course/page#top',
+        'http://course/f?sessionid=1&b=2&a=1#x',
+        'http://course/f?a=1&b=2&sessionid=2',
+        'http://course/./notes%7e.pdf?utm_source=mail',
+        ])
+    @contextmanager
+    def open_driver():
+        yield driver
+    monkeypatch.setattr(scrapers, 'open_driver', open_driver)
+
+    resources = scrapers.SeleniumScraper().collect_resources(
+        [{'source': 'http://course/page', 'strip_params': ['sessionid']}], cookies=[])
+    # Fetched as linked, but only once per canonical url
+    assert resources == [
+        {'url': 'http://course/f?sessionid=1&b=2&a=1', 'source': 'http://course/page'},
+        {'url': 'http://course/./notes%7e.pdf?utm_source=mail', 'source': 'http://course/page'},
+        ]
@@ -0,0 +1,74 @@
+import json
+import os
+import os.path
+import time
+
+from lecdown.config import Record, Status, Strategy, config
+from lecdown.downloader import check_all, stat_signature
+from lecdown.watcher import EVENTS_FILE, IN_MOVED_TO, Inotify, pending_paths
+
+
+def write_events(session, paths, pid=None):
+    with open(EVENTS_FILE, 'w') as f:
+        f.write(json.dumps({'pid': pid or os.getpid(), 'session': session}) + '\n')
+        for path in paths:
+            f.write(json.dumps(path) + '\n')
+
+
+def test_inotify_reports_moves(integration_env):
+    inotify = Inotify()
+    try:
+        inotify.add_watch('')
+        with open('file', 'w') as f:
+            f.write('original')
+        os.rename('file', 'file2')
+        events = list(inotify.read_events())
+    finally:
+        inotify.close()
+    assert any(mask & IN_MOVED_TO and name == 'file2' for _, mask, name in events)
+
+
+def test_pending_paths(integration_env):
+    # No watcher: full check
+    assert pending_paths() is None
+
+    # New watcher session: full check, then only new events
+    write_events(1, ['a'])
+    assert pending_paths() is None
+    assert pending_paths() == set()
+    with open(EVENTS_FILE, 'a') as f:
+        f.write(json.dumps('b') + '\n' + json.dumps('c'))  # c is incomplete
+    assert pending_paths() == {'b'}
+
+    # Lost events: full check
+    with open(EVENTS_FILE, 'a') as f:
+        f.write('\n' + json.dumps(None) + '\n')
+    assert pending_paths() is None
+    assert pending_paths() == set()
+
+    # Dead watcher: full check
+    write_events(1, [], pid=2 ** 22 + 1)
+    assert pending_paths() is None
+    assert 'watch' not in config
+
+
+def test_check_only_pending_paths(integration_env):
+    records = {}
+    for name in ['file', 'file2']:
+        with open(name, 'w') as f:
+            f.write(name)
+        stat = os.stat(name)
+        records['http://' + name] = Record(
+            last_status=Status.UPDATED, updated_at=time.time()-10,
+            local_path=name, strategy=Strategy.SYNC, inode=[stat.st_dev, stat.st_ino],
+            local_signature=stat_signature(stat))
+    config['records'].update(records)
+
+    os.makedirs('sub')
+    os.rename('file', os.path.join('sub', 'file'))
+    os.unlink('file2')
+
+    # Only the move was reported
+    changes = check_all(paths={'file', 'sub'})
+    assert changes == [('http://file', 'file', os.path.join('sub', 'file'))]
+    assert records['http://file2'].local_path == 'file2'